@@ -1,19 +1,56 @@
 ﻿#__init__.py
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QLabel, QFileDialog, QGraphicsOpacityEffect, QTextEdit
-from PyQt5.QtCore import Qt, QPoint, QTimer, QPropertyAnimation, QEasingCurve
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QLabel, QFileDialog, QGraphicsOpacityEffect, QTextEdit, QMessageBox
+from PyQt5.QtCore import Qt, QPoint, QTimer, QPropertyAnimation, QEasingCurve, pyqtSignal
 from PyQt5.QtGui import QPixmap, QFont, QLinearGradient, QBrush, QPainter, QPen, QColor
 import sys, os
 import cv2
-import numpy as np
 import matplotlib.pyplot as plt
 import rdh
 import crdh
+import output_writer
+import profiling
+import thumbnails
+import image_cache
+import batch_jobs
+import sidecar
+import time
+from image_io import collect_images
 import datetime
+from collections import deque
 
 from encodeWindow import EncodeWindow
 from decodeWindow import DecodeWindow
+from job_queue_widget import JobQueueWidget
+
+# Dashboard log settings
+DASHBOARD_MAX_LINES = 500        # lines kept in the view (and pending in the queue)
+DASHBOARD_LINE_DELAY = 500       # ms between lines in the line-by-line animation
+DASHBOARD_FRAME_DELAY = 16       # ms between frames in throughput mode
+DASHBOARD_BATCH_SIZE = 50        # lines appended per frame in throughput mode
+DASHBOARD_BACKLOG_LINES = 4      # switch to throughput mode above this many pending lines
+
+# Output settings (lossless only: png / tiff / webp / npy)
+OUTPUT_FORMAT = 'png'
+OUTPUT_PNG_LEVEL = 1             # 0-9; low levels encode much faster for a few % more bytes
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tempFile", "jobs")
+OUTPUT_WORKERS = 2
+OUTPUT_SIDECAR = 'json'          # embed-time metadata for one-pass decoding: 'json' (<image>.rdh.json), 'png' (tEXt chunk, PNG output only) or None
+
+# Profiling: per-stage wall time / allocations table in the dashboard, exported as JSON next to the outputs
+PROFILE_RUNS = False
+PROFILE_CPROFILE = False         # also run under cProfile and save a .prof file
+
+# Session image cache: decoded inputs / outputs, their Y planes and histograms
+IMAGE_CACHE_MB = 256
+
+# Batch queue (drop several images or a folder on a drop zone)
+BATCH_WORKERS = None             # worker processes; None = one per CPU
+BATCH_MAX_LAYERS = 1             # greedy layers tried when the planner finds no one- or two-pair plan
 
 class MainWindow(QMainWindow):
+    output_written = pyqtSignal(dict)  # write report from the output worker threads
+    job_finished = pyqtSignal(int, dict)  # (row, report) from the batch worker pool
+
     def __init__(self):
         super().__init__()
 
@@ -25,6 +62,8 @@ class MainWindow(QMainWindow):
         self.is_encoding = True
         self.current_encoding_image_path = None
         self.current_decoding_image_path = None
+        self.encoding_mask = None  # optional ROI mask (binary array)
+        self.decoding_mask = None
 
         #background color settings
         self.color_block = QWidget(self)
@@ -81,6 +120,8 @@ class MainWindow(QMainWindow):
             padding: 10px;
         """
         )
+        # Ring buffer: the oldest lines are dropped once the cap is reached
+        self.dashboard.document().setMaximumBlockCount(DASHBOARD_MAX_LINES)
 
         #toggle object
         self.icon_label.mouseDoubleClickEvent = self.toggle_mode
@@ -91,11 +132,30 @@ class MainWindow(QMainWindow):
         #encode image transmission
         self.encoded_pixmap_transmission = None
 
+        # Preview thumbnails shared by both modes (each image is decoded and shrunk once)
+        self.thumbnails = thumbnails.ThumbnailCache()
+        # Full-size images of this session, so re-runs and encode -> decode skip the disk
+        self.images = image_cache.ImageCache(IMAGE_CACHE_MB * 1024 * 1024)
+
         # Animation attributes
-        self.message_queue = []  # Queue to store messages and their colors
+        self.message_queue = deque(maxlen=DASHBOARD_MAX_LINES)  # Queue to store messages and their colors
+        self.dashboard_throughput_mode = False  # Force batched appends (e.g. for batch jobs)
         self.timer = QTimer(self)  # Timer for line-by-line animation
         self.timer.timeout.connect(self.animate_message)
 
+        # Background output writer; pending_writes maps path -> future until the file is on disk
+        self.output_writer = output_writer.OutputWriter(OUTPUT_DIR, OUTPUT_FORMAT, OUTPUT_PNG_LEVEL, OUTPUT_WORKERS)
+        self.pending_writes = {}
+        self.output_written.connect(self.on_output_written)
+        self.sidecars = {}  # output path -> sidecar of images embedded this session
+
+        # Batch job queue, in the free area right of the dashboard
+        self.job_queue = JobQueueWidget(self)
+        self.job_queue.setGeometry(1040, 40, 330, 240)
+        self.batch_runner = batch_jobs.BatchRunner(BATCH_WORKERS)
+        self.batch = {'total': 0, 'done': 0, 'failed': 0, 'pixels': 0, 'start': None}
+        self.job_finished.connect(self.on_job_finished)
+
 
     def set_icon(self, path):
         pixmap = QPixmap(path).scaled(160, 160, Qt.KeepAspectRatio, Qt.SmoothTransformation)
@@ -129,21 +189,55 @@ class MainWindow(QMainWindow):
             self,
             "Select Image",
             "",
+            "Images (*.png *.jpg *.jpeg *.bmp *.tif *.tiff *.webp *.npy)"
+        )
+        if path:
+            self.set_input_image(path, mode)
+
+    def set_input_image(self, path, mode):
+        """Make `path` the current input of a mode (file dialog or a single dropped image)."""
+        # Decode the file once: the preview and later runs use the cached array
+        img = self.images.get(path)
+        if img is not None:
+            self.thumbnails.put_array(path, img, os.path.getmtime(path))
+        if mode == 'encoding':
+            self.current_encoding_image_path = path
+            pixmap = self.thumbnails.get(path, 300)
+            self.encoding_container.enc_image_preview.setPixmap(pixmap)
+            self.encoding_container.enc_image_preview.setText("")
+        else:
+            self.current_decoding_image_path = path
+            pixmap = self.thumbnails.get(path, 280)
+            self.decoding_container.dec_image_preview.setPixmap(pixmap)
+            self.decoding_container.dec_image_preview.setText("")
+
+    def select_mask(self, mode):
+        """Pick a binary ROI mask image (white = may be modified); cancelling clears the mask."""
+        path, _ = QFileDialog.getOpenFileName(
+            self,
+            "Select Mask (white = embed here, cancel = no mask)",
+            "",
             "Images (*.png *.jpg *.jpeg *.bmp)"
         )
+        color = "lightpink" if mode == 'encoding' else "red"
+        mask = None
         if path:
-            if mode == 'encoding':
-                self.current_encoding_image_path = path
-                pixmap = QPixmap(path).scaled(300, 300, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                self.encoding_container.enc_image_preview.setPixmap(pixmap)
-                self.encoding_container.enc_image_preview.setText("")
-            else:
-                self.current_decoding_image_path = path
-                pixmap = QPixmap(path).scaled(280, 280, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                self.decoding_container.dec_image_preview.setPixmap(pixmap)
-                self.decoding_container.dec_image_preview.setText("")
+            try:
+                mask = rdh.load_mask(path)
+            except ValueError as e:
+                self.dashboard_message_display(str(e), color)
+                return
+        if mode == 'encoding':
+            self.encoding_mask = mask
+        else:
+            self.decoding_mask = mask
+        if mask is None:
+            self.dashboard_message_display("Mask cleared, the whole image is used", "grey")
+        else:
+            self.dashboard_message_display(f"Mask loaded: {int(mask.sum())} of {mask.size} pixels may be modified", "grey")
 
     def run_encoding(self):
+        profiler = profiling.StageProfiler(enabled=PROFILE_RUNS, use_cprofile=PROFILE_CPROFILE)
         try:
             #image selection
             if not self.current_encoding_image_path:            
@@ -156,11 +250,12 @@ class MainWindow(QMainWindow):
                 self.dashboard_message_display("Please enter text to encode!", "lightpink")
                 return
 
-            #char to bits
-            message_bits = ''.join(format(ord(c), '08b') for c in message)
+            #text to UTF-8 bits
+            message_bits = rdh.text_to_bits(message)
 
             #image path variable
-            img_color = cv2.imread(self.current_encoding_image_path)
+            with profiler.stage("imread"):
+                img_color = self.load_input(self.current_encoding_image_path)
 
             if img_color is None:
                 self.dashboard_message_display("Failed to load image!","lightpink")
@@ -169,28 +264,54 @@ class MainWindow(QMainWindow):
             self.dashboard_message_display("Load image successful!","grey")
 
 
-            img_ycrcb = cv2.cvtColor(img_color, cv2.COLOR_BGR2YCrCb)
-            img_y = img_ycrcb[:, :, 0]
-            hist = cv2.calcHist([img_y], [0], None, [256], [0, 256])
-            peak = int(np.argmax(hist))
-            peak_bits = format(peak, '08b')
-            length_prefix = format(len(message_bits), '016b')
-            full_data_bits = peak_bits + length_prefix + message_bits
-            capacity = int(hist[peak][0])
-            if len(full_data_bits) > capacity:
-                self.dashboard_message_display("Error", f"Data too large to embed.\nRequired: {len(full_data_bits)} bits, Available: {capacity} bit","blue")
+            # Estimate capacity vs distortion from the (ROI) histogram before embedding
+            mask = self.encoding_mask
+            if mask is not None and mask.shape != img_color.shape[:2]:
+                self.dashboard_message_display("Mask size does not match the image!", "lightpink")
                 return
-            self.dashboard_message_display("Data embedded","grey")
-            embedded_color, used_bits = rdh.embed_data_color(img_color, full_data_bits, peak)
-            embedded_path = os.path.join(os.path.dirname(__file__), "tempFile", "temp_embedded.png")
-            cv2.imwrite(embedded_path, embedded_color)
+            with profiler.stage("Y plane + histogram (cached)"):
+                img_y, img_hist = self.images.planes(self.current_encoding_image_path)
+            side_bits = 8 * len(rdh.encode_mask(mask, img_y.shape))
+            if mask is None:
+                plan_hist = img_hist
+            else:
+                plan_hist = cv2.calcHist([rdh.region_plane(img_y, rdh.mask_region(mask, img_y.shape))], [0], None, [256], [0, 256])
+            choice = self.confirm_layer_plan(plan_hist, len(message_bits), side_bits)
+            if choice is None:
+                return
+            max_layers, pairs = choice
 
-            embedded_pixmap = QPixmap(embedded_path).scaled(400, 400, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            # Pick peak / zero bin, build header + location map, embed
+            key = self.encoding_container.enc_key_box.text() or None
+            with profiler.stage("embed"):
+                result, error = rdh.embed_message_color(img_color, message_bits, key=key, max_layers=max_layers,
+                                                        mask=mask, profiler=profiler, plan=pairs, hist=img_hist)
+            if error:
+                self.dashboard_message_display(error, "lightpink")
+                return
+            embedded_color = result['embedded_img']
+            used_bits = result['used_bits']
+            capacity = result['capacity']
+            peak = result['peak']
+            hist = result['hist']
+            self.dashboard_message_display("Data embedded","grey")
+            with profiler.stage("imwrite (queued)"):
+                meta = sidecar.build(result, message.encode('utf-8'), keyed=key is not None) if OUTPUT_SIDECAR else None
+                text = sidecar.png_text(meta) if OUTPUT_SIDECAR == 'png' and OUTPUT_FORMAT == 'png' else None
+                embedded_path = self.save_output(embedded_color, "temp_embedded", text)
+                if meta:
+                    self.sidecars[embedded_path] = meta
+                    if text is None:
+                        sidecar.write(embedded_path, meta)
+
+            # Decoding this result next reads it from memory, not from the file being written
+            self.images.put_array(embedded_path, embedded_color)
+            with profiler.stage("thumbnail"):
+                self.thumbnails.put_array(embedded_path, embedded_color)
+                embedded_pixmap = self.thumbnails.get(embedded_path, 400)
             self.encoding_container.enc_encoded_image.setPixmap(embedded_pixmap)
             self.dashboard_message_display("Embedding image completed!","grey")
-            embedded_ycrcb = cv2.cvtColor(embedded_color, cv2.COLOR_BGR2YCrCb)
-            embedded_y = embedded_ycrcb[:, :, 0]
-            hist_embedded = cv2.calcHist([embedded_y], [0], None, [256], [0, 256])
+            hist_embedded = result['hist_embedded']
 
             #paint original histogram
             self.encoding_container.enc_histograms[0].set_histogram_data(hist, title="Original Y Histogram", color=QColor(100, 150, 255), peak=peak)
@@ -203,16 +324,19 @@ class MainWindow(QMainWindow):
             #display debug info
             debug_info = (
                 f"<br>Used bits: {used_bits} / Capacity: {capacity} ({(used_bits / capacity * 100):.2f}%)"
-                f"<br>Full data bits length: {len(full_data_bits)}"
+                f"<br>Full data bits length: {result['full_data_bits']}"
+                f"<br>Zero bin: {result['zero']} (overflow pixels: {result['overflow']}, location map: {result['location_map_bytes']} bytes)"
                 f"<br>Image path: {self.current_encoding_image_path}"
             )
             self.dashboard_message_display(debug_info,"white")
 
             #show peak value
+            if len(result['layers']) > 1:
+                self.dashboard_message_display(f"Layers: {len(result['layers'])} (decoding starts from the outermost peak)", "white")
             self.dashboard_message_display(f"Peak: {peak}", "gold")
 
             #transmit emcoded img to decode mode
-            self.encoded_pixmap_transmission = embedded_pixmap
+            self.encoded_pixmap_transmission = self.thumbnails.get(embedded_path, 280)
             self.decoding_container.dec_image_preview.setPixmap(self.encoded_pixmap_transmission)
             self.current_decoding_image_path = embedded_path
             self.dashboard_message_display("Encoded image transmitted to decoding mode","green")
@@ -222,15 +346,49 @@ class MainWindow(QMainWindow):
 
         except Exception as e:
             self.dashboard_message_display("An error occurred during encoding","lightpink")
+        finally:
+            self.report_profile(profiler, "encode")
 
-    def run_decoding(self):
+    def confirm_layer_plan(self, hist, payload_bits, side_bits=0):
+        """
+        Return (max_layers, pairs) for embedding, or None to cancel.
+        The planner's cheapest one- or two-pair plan is used when one fits;
+        otherwise fall back to greedy layers, asking before going multi-layer.
+        """
+        best = rdh.plan_embedding(hist, payload_bits, side_bits)
+        if best is not None:
+            pairs = ", ".join(f"peak {p} / zero {z}" for p, z in best['pairs'])
+            self.dashboard_message_display(
+                f"Plan: {pairs}, {best['shifted']} pixels shifted, predicted PSNR {best['psnr']:.2f} dB", "white")
+            return len(best['pairs']), best['pairs']
+
+        plan = rdh.estimate_layers(hist, payload_bits)
+        planned = sum(p['bits'] for p in plan)
+        if planned < payload_bits:
+            self.dashboard_message_display(
+                f"Data too large to embed. Required: {payload_bits} bits, Available: about {planned} bits in {len(plan)} layer(s)",
+                "lightpink")
+            return None
+        if len(plan) == 1:
+            return 1, None
+
+        for p in plan:
+            self.dashboard_message_display(
+                f"Layer {p['layer']}: peak {p['peak']}, {p['bits']} bits, predicted PSNR {p['psnr']:.2f} dB", "white")
+        answer = QMessageBox.question(
+            self, "Multi-layer embedding",
+            f"The message needs {len(plan)} layers.\nPredicted PSNR: {plan[-1]['psnr']:.2f} dB\n\nEmbed anyway?")
+        return (len(plan), None) if answer == QMessageBox.Yes else None
 
+    def run_decoding(self):
+        profiler = profiling.StageProfiler(enabled=PROFILE_RUNS, use_cprofile=PROFILE_CPROFILE)
         try:
             if not self.current_decoding_image_path:
                 self.dashboard_message_display("Please select an image first!", "red")
                 return
 
-            img_color = cv2.imread(self.current_decoding_image_path)
+            with profiler.stage("imread"):
+                img_color = self.load_input(self.current_decoding_image_path)
             if img_color is None:
                 self.dashboard_message_display("Failed to load image!", "red")
                 return
@@ -238,25 +396,43 @@ class MainWindow(QMainWindow):
             #get peak value from input box
             manual_peak_text = self.decoding_container.dec_input_box.text().strip()
             manual_peak = int(manual_peak_text) if manual_peak_text.isdigit() else None
+            key = self.decoding_container.dec_key_box.text() or None
 
             self.dashboard_message_display("Starting decoding process...", "grey")
 
             # Pass the manual_peak to crdh.decode_image, using it as the peak if provided
-            result, error = crdh.decode_image(img_color, manual_peak=manual_peak)
+            if self.decoding_mask is not None and self.decoding_mask.shape != img_color.shape[:2]:
+                self.dashboard_message_display("Mask size does not match the image!", "red")
+                return
+            with profiler.stage("Y histogram (cached)"):
+                _, img_hist = self.images.planes(self.current_decoding_image_path)
+            with profiler.stage("sidecar"):
+                meta = self.sidecars.get(self.current_decoding_image_path) or sidecar.read(self.current_decoding_image_path)
+            with profiler.stage("decode"):
+                result, error = crdh.decode_image(img_color, manual_peak=manual_peak, key=key, mask=self.decoding_mask,
+                                                  profiler=profiler, hist=img_hist, sidecar=meta)
 
             if error:
                 self.dashboard_message_display(error, "red")
                 return
 
+            if not result['is_text']:
+                # Not UTF-8: a binary payload, show its size and first bytes instead
+                preview = result['payload'][:16].hex(' ')
+                result['message'] = f"<binary payload, {len(result['payload'])} bytes>"
+                self.dashboard_message_display(f"Binary payload starts with: {preview}", "grey")
             self.decoding_container.dec_decoded_text.setText(result['message'])
             self.dashboard_message_display(f"Decoded message: {result['message']}", "grey")
 
             # restore img
             restored_img = result['restored_img']
-            restored_path = os.path.join(os.path.dirname(__file__), "tempFile", "restored_image.png")
-            cv2.imwrite(restored_path, restored_img)
+            with profiler.stage("imwrite (queued)"):
+                restored_path = self.save_output(restored_img, "restored_image")
 
-            restored_pixmap = QPixmap(restored_path).scaled(350, 350, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self.images.put_array(restored_path, restored_img)
+            with profiler.stage("thumbnail"):
+                self.thumbnails.put_array(restored_path, restored_img)
+                restored_pixmap = self.thumbnails.get(restored_path, 350)
             self.decoding_container.dec_decoded_image.setPixmap(restored_pixmap)
             self.dashboard_message_display("Restored image displayed.", "grey")
 
@@ -272,6 +448,8 @@ class MainWindow(QMainWindow):
                 color=QColor(100, 150, 255), peak=result['extracted_peak']
             )
             self.dashboard_message_display("Restored Y histogram updated.", "grey")
+            if result['layers'] > 1:
+                self.dashboard_message_display(f"Peeled {result['layers']} layers.", "grey")
     
             # show decoded info
             for log in result.get('logs', []):
@@ -283,8 +461,134 @@ class MainWindow(QMainWindow):
 
         except Exception as e:
             self.dashboard_message_display(f"Error: {str(e)}", "red")
+        finally:
+            self.report_profile(profiler, "decode")
+
+
+
+    def save_output(self, img, prefix, text=None):
+        """Queue `img` on the output writer and return the job's unique path (`text`: optional PNG tEXt chunk)."""
+        path, future = self.output_writer.submit(img, prefix, text)
+        self.pending_writes[path] = future
+        # Runs on the worker thread; the signal hands the report to the GUI thread
+        future.add_done_callback(lambda f: self.output_written.emit(f.result()))
+        return path
+
+    def on_output_written(self, report):
+        self.pending_writes.pop(report['path'], None)
+        if report['error']:
+            self.dashboard_message_display(f"Saving failed: {report['error']}", "red")
+            return
+        self.dashboard_message_display(
+            f"Saved {os.path.basename(report['path'])}: {report['bytes'] / 1024:.1f} KB, "
+            f"{report['format'].upper()} encoded in {report['encode_ms']:.1f} ms", "grey")
+
+    def report_profile(self, profiler, run):
+        """Show the stage table in the dashboard and export it (profiling mode only)."""
+        profiler.close()
+        if not profiler.records:
+            return
+        self.dashboard_message_display(f"Profile ({run}):", "gold")
+        for line in profiler.table():
+            # keep the column alignment in the HTML dashboard
+            self.dashboard_message_display(line.replace(' ', '&nbsp;'), "white")
+        json_path = output_writer.job_path(OUTPUT_DIR, f"profile_{run}", 'json')
+        profiler.export_json(json_path)
+        if PROFILE_CPROFILE:
+            profiler.dump_cprofile(os.path.splitext(json_path)[0] + ".prof")
+        self.dashboard_message_display(f"Profile saved to {os.path.basename(json_path)}", "grey")
+
+    def load_input(self, path):
+        """
+        Load an input image from the session cache, or from disk (waiting for
+        the file if it is still being written). The array is read-only.
+        """
+        if path not in self.images:
+            future = self.pending_writes.get(path)
+            if future is not None:
+                future.result()
+        return self.images.get(path)
 
+    def enqueue_batch(self, inputs, mode):
+        """
+        Queue every image in `inputs` (files and folders) as a batch job of
+        `mode`, using the message / key / peak / mask currently entered.
+        """
+        paths = collect_images(inputs)
+        color = "lightpink" if mode == 'encoding' else "red"
+        if not paths:
+            self.dashboard_message_display("No images found in the dropped items", color)
+            return
 
+        if mode == 'encoding':
+            message = self.encoding_container.enc_textbox.text().strip()
+            if not message:
+                self.dashboard_message_display("Please enter text to encode before dropping a batch!", color)
+                return
+            key = self.encoding_container.enc_key_box.text() or None
+            args = (rdh.text_to_bits(message), key, self.encoding_mask, BATCH_MAX_LAYERS)
+            extra = (OUTPUT_SIDECAR,)
+            job = batch_jobs.encode_job
+        else:
+            manual_peak_text = self.decoding_container.dec_input_box.text().strip()
+            key = self.decoding_container.dec_key_box.text() or None
+            args = (int(manual_peak_text) if manual_peak_text.isdigit() else None, key, self.decoding_mask)
+            extra = ()
+            job = batch_jobs.decode_job
+
+        if self.batch['done'] == self.batch['total']:
+            # Previous batch finished: start a fresh list and throughput count
+            self.job_queue.clear_jobs()
+            self.batch = {'total': 0, 'done': 0, 'failed': 0, 'pixels': 0, 'start': time.perf_counter()}
+        self.dashboard_throughput_mode = True
+        for path in paths:
+            row = self.job_queue.add_job(path, mode)
+            future = self.batch_runner.submit(job, path, *args, OUTPUT_DIR, OUTPUT_FORMAT, OUTPUT_PNG_LEVEL, *extra)
+            # Runs on the pool's thread; the signal hands the report to the GUI thread
+            future.add_done_callback(lambda f, row=row, path=path: self.job_finished.emit(row, self.job_report(f, path, mode)))
+        self.batch['total'] += len(paths)
+        self.dashboard_message_display(f"Queued {len(paths)} {mode} job(s)", color)
+        self.update_batch_summary()
+
+    @staticmethod
+    def job_report(future, path, mode):
+        try:
+            return future.result()
+        except Exception as e:  # worker crashed or the pool was shut down
+            return {'path': path, 'mode': 'encode' if mode == 'encoding' else 'decode', 'status': 'FAIL', 'error': str(e) or type(e).__name__,
+                    'output': None, 'pixels': 0, 'job_ms': None, 'bytes': None, 'peak': None, 'message': None}
+
+    def on_job_finished(self, row, report):
+        self.job_queue.set_status(row, report)
+        self.batch['done'] += 1
+        self.batch['pixels'] += report['pixels']
+        name = os.path.basename(report['path'])
+        if report['status'] != 'OK':
+            self.batch['failed'] += 1
+            self.dashboard_message_display(f"{name}: {report['error']}", "red")
+        elif report['mode'] == 'decode':
+            self.dashboard_message_display(f"{name}: peak {report['peak']}, message: {report['message']}", "grey")
+        else:
+            self.dashboard_message_display(f"{name}: peak {report['peak']} -> {os.path.basename(report['output'])}", "grey")
+        self.update_batch_summary()
+        if self.batch['done'] == self.batch['total']:
+            self.dashboard_throughput_mode = False
+            self.dashboard_message_display(
+                f"Batch finished: {self.batch['done'] - self.batch['failed']} OK, {self.batch['failed']} failed", "green")
+
+    def update_batch_summary(self):
+        b = self.batch
+        elapsed = time.perf_counter() - b['start']
+        rate = f"{b['done'] / elapsed:.1f} img/s, {b['pixels'] / elapsed / 1e6:.1f} MP/s" if b['done'] and elapsed > 0 else "-"
+        running = b['total'] - b['done']
+        self.job_queue.set_summary(f"Jobs {b['done']}/{b['total']} done ({b['failed']} failed), {running} left | {rate}")
+
+    def closeEvent(self, e):
+        # Queued batch jobs are dropped; running ones finish in their processes
+        self.batch_runner.shutdown(wait=False)
+        # Let queued outputs finish so no half-written file is left behind
+        self.output_writer.shutdown(wait=True)
+        super().closeEvent(e)
 
     def mousePressEvent(self, e):
         if e.button() == Qt.LeftButton:
@@ -307,18 +611,33 @@ class MainWindow(QMainWindow):
         self.message_queue.append(formatted_message)
         # Start animation if not already running
         if not self.timer.isActive():
-            self.timer.start(500)  # 500ms delay between lines
+            self.timer.start(DASHBOARD_LINE_DELAY)
 
     def animate_message(self):
-        # Display the next message in the queue
-        if self.message_queue:
-            message = self.message_queue.pop(0)
-            self.dashboard.append(message)
-            # Auto-scroll to bottom
-            self.dashboard.verticalScrollBar().setValue(self.dashboard.verticalScrollBar().maximum())
-        else:
+        if not self.message_queue:
             # Stop timer if queue is empty
             self.timer.stop()
+            return
+
+        throughput = self.dashboard_throughput_mode or len(self.message_queue) > DASHBOARD_BACKLOG_LINES
+        if throughput:
+            # Append a whole batch per frame so the log keeps up with fast jobs
+            # (one block per line, so the view's block cap is a line cap)
+            count = min(DASHBOARD_BATCH_SIZE, len(self.message_queue))
+            self.dashboard.setUpdatesEnabled(False)
+            for _ in range(count):
+                self.dashboard.append(self.message_queue.popleft())
+            self.dashboard.setUpdatesEnabled(True)
+        else:
+            # Display the next message in the queue
+            self.dashboard.append(self.message_queue.popleft())
+
+        # Auto-scroll to bottom
+        self.dashboard.verticalScrollBar().setValue(self.dashboard.verticalScrollBar().maximum())
+
+        # Frame rate while a backlog remains, line-by-line delay otherwise
+        throughput = self.dashboard_throughput_mode or len(self.message_queue) > DASHBOARD_BACKLOG_LINES
+        self.timer.setInterval(DASHBOARD_FRAME_DELAY if throughput else DASHBOARD_LINE_DELAY)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,206 @@
+# audit.py
+# Reversibility audit: embed -> decode -> restore on a batch of images and
+# check that every restored image is bit-identical to its original.
+#
+#   python audit.py images/ more.png --message "audit" --workers 4 --out tempFile/audit_summary.json
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+import rdh
+import crdh
+import output_writer
+from image_io import collect_images, parse_rects
+
+def psnr(original, other):
+    """PSNR (dB)；完全相同時回傳 inf"""
+    diff = original.astype(np.float64) - other.astype(np.float64)
+    mse = np.mean(diff * diff)
+    if mse == 0:
+        return float('inf')
+    return float(10 * np.log10(255.0 ** 2 / mse))
+
+def ssim(original, other):
+    """單通道 SSIM（11x11 Gaussian window, sigma 1.5）"""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    a = original.astype(np.float64)
+    b = other.astype(np.float64)
+
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a * mu_a
+    var_b = blur(b * b) - mu_b * mu_b
+    cov = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+def diff_report(original, restored):
+    """逐像素比對：不同像素數、最大差值與差異範圍 (x0, y0, x1, y1)"""
+    diff = original != restored
+    if diff.ndim == 3:
+        diff = diff.any(axis=2)
+    count = int(np.count_nonzero(diff))
+    if count == 0:
+        return {'diff_pixels': 0, 'max_abs_diff': 0, 'diff_bbox': None}
+    rows = np.flatnonzero(diff.any(axis=1))
+    cols = np.flatnonzero(diff.any(axis=0))
+    max_abs = int(np.max(np.abs(original.astype(np.int16) - restored.astype(np.int16))))
+    return {
+        'diff_pixels': count,
+        'max_abs_diff': max_abs,
+        'diff_bbox': [int(cols[0]), int(rows[0]), int(cols[-1]), int(rows[-1])]
+    }
+
+def audit_image(path, message="RDH audit", key=None, max_layers=1, mask=None, method='hs'):
+    """
+    對單張影像執行 embed / decode / restore 並比對（message: 文字或 bytes；mask: 矩形列表或遮罩影像路徑）
+    `method` is 'hs' (histogram shifting) or 'de' (difference expansion).
+    """
+    report = {'path': path, 'status': 'FAIL', 'error': None}
+
+    img = output_writer.load_image(path)
+    if img is None:
+        report['error'] = "Failed to load image"
+        return report
+
+    if isinstance(mask, str):
+        mask = rdh.load_mask(mask)
+
+    # rdh / crdh print debug lines for every step; keep the summary readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        payload = message if isinstance(message, bytes) else message.encode('utf-8')
+        message_bits = rdh.bytes_to_bits(payload)
+        if method == 'de':
+            embedded, error = rdh.embed_message_de(img, message_bits, key=key, mask=mask)
+        else:
+            embedded, error = rdh.embed_message_color(img, message_bits, key=key, max_layers=max_layers, mask=mask)
+        if error:
+            report['error'] = error
+            return report
+        # Difference-expansion images are found by their header, not by a peak
+        decoded, error = crdh.decode_image(embedded['embedded_img'], manual_peak=embedded['peak'] if method == 'hs' else None,
+                                           key=key, mask=mask)
+    if error:
+        report['error'] = error
+        return report
+
+    original_y = cv2.cvtColor(img, cv2.COLOR_BGR2YCrCb)[:, :, 0]
+    embedded_y = cv2.cvtColor(embedded['embedded_img'], cv2.COLOR_BGR2YCrCb)[:, :, 0]
+    restored_y = cv2.cvtColor(decoded['restored_img'], cv2.COLOR_BGR2YCrCb)[:, :, 0]
+
+    y_diff = diff_report(original_y, restored_y)
+    bgr_diff = diff_report(img, decoded['restored_img'])
+
+    report.update({
+        'peak': embedded['peak'],
+        'zero': embedded['zero'],
+        'layers': len(embedded['layers']) if method == 'hs' else 1,
+        'region_pixels': embedded['region_pixels'],
+        'message_ok': decoded['payload'] == payload,
+        'y_exact': y_diff['diff_pixels'] == 0,
+        'bgr_exact': bgr_diff['diff_pixels'] == 0,
+        'y_diff': y_diff,
+        'bgr_diff': bgr_diff,
+        'psnr_embedded': psnr(original_y, embedded_y),
+        'ssim_embedded': ssim(original_y, embedded_y),
+        'psnr_restored': psnr(original_y, restored_y),
+        'ssim_restored': ssim(original_y, restored_y),
+    })
+
+    # EXACT: the whole BGR image is restored; Y-EXACT: only the Y plane the data lives in
+    if report['message_ok'] and report['bgr_exact']:
+        report['status'] = 'EXACT'
+    elif report['message_ok'] and report['y_exact']:
+        report['status'] = 'Y-EXACT'
+    return report
+
+def run_audit(paths, message="RDH audit", workers=None, key=None, max_layers=1, mask=None, method='hs'):
+    """
+    平行稽核多張影像（每個檔案一個 process 任務）
+    Reports come back in `paths` order. A job that raises (e.g. an
+    unreadable mask or an array that is not an image) becomes a FAIL
+    report, so one bad input never aborts the audit.
+    """
+    reports = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(audit_image, path, message, key, max_layers, mask, method): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                reports[path] = future.result()
+            except Exception as e:  # the job raised, or its worker crashed
+                reports[path] = {'path': path, 'status': 'FAIL', 'error': str(e) or type(e).__name__}
+    return [reports[path] for path in paths]
+
+def summarize(reports):
+    counts = {'EXACT': 0, 'Y-EXACT': 0, 'FAIL': 0}
+    for r in reports:
+        counts[r['status']] += 1
+    return {
+        'total': len(reports),
+        'counts': counts,
+        'flagged': [r['path'] for r in reports if r['status'] != 'EXACT'],
+        'images': reports
+    }
+
+def _json_float(value):
+    # JSON has no inf; identical images report PSNR as "inf"
+    return "inf" if value == float('inf') else value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RDH reversibility audit")
+    parser.add_argument('inputs', nargs='+', help="image files or folders")
+    parser.add_argument('--message', default="RDH audit", help="payload embedded in every image")
+    parser.add_argument('--payload-file', default=None, help="embed this file's bytes instead of --message")
+    parser.add_argument('--key', default=None, help="secret key for the carrier order")
+    parser.add_argument('--max-layers', type=int, default=1, help="allow multi-layer embedding")
+    parser.add_argument('--method', choices=('hs', 'de'), default='hs',
+                        help="histogram shifting or difference expansion")
+    parser.add_argument('--mask', default=None, help="binary mask image (white = may be modified)")
+    parser.add_argument('--rects', default=None, help="ROI rectangles 'x,y,w,h;x,y,w,h'")
+    parser.add_argument('--workers', type=int, default=None, help="parallel worker processes")
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "tempFile", "audit_summary.json"))
+    args = parser.parse_args(argv)
+
+    paths = collect_images(args.inputs)
+    if not paths:
+        print("No images found")
+        return 1
+
+    message = args.message
+    if args.payload_file:
+        with open(args.payload_file, 'rb') as f:
+            message = f.read()
+
+    mask = parse_rects(args.rects) if args.rects else args.mask
+    summary = summarize(run_audit(paths, message, args.workers, args.key, args.max_layers, mask, args.method))
+
+    for r in summary['images']:
+        if r['error']:
+            print(f"{r['status']:8} {r['path']}  error: {r['error']}")
+        else:
+            print(f"{r['status']:8} {r['path']}  Y diff={r['y_diff']['diff_pixels']}  "
+                  f"BGR diff={r['bgr_diff']['diff_pixels']}  "
+                  f"embedded PSNR={r['psnr_embedded']:.2f} dB SSIM={r['ssim_embedded']:.4f}")
+    print(f"Total {summary['total']}: {summary['counts']}")
+
+    for r in summary['images']:
+        for key in ('psnr_embedded', 'psnr_restored'):
+            if key in r:
+                r[key] = _json_float(r[key])
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    print(f"Summary written to {args.out}")
+
+    return 0 if not summary['flagged'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# batch_jobs.py
+# Batch encode / decode jobs for the GUI's job queue: one image per job,
+# run on a process pool. The jobs need no Qt, but spawned workers re-import
+# the launching script as __mp_main__, so a pool started by the GUI loads
+# PyQt5 and matplotlib in every worker; BatchRunner keeps its workers for
+# the session, so that cost is paid once per worker.
+import contextlib
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import rdh
+import crdh
+import output_writer
+import sidecar
+
+def warm_worker():
+    """
+    Pool initializer: embeds and decodes a tiny gray image once, so cv2,
+    rdh / crdh and the kernels (Numba compiles or loads its cache here)
+    are ready before the worker's first real job.
+    """
+    img = np.full((16, 16, 3), 128, np.uint8)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result, error = rdh.embed_message_color(img, rdh.bytes_to_bits(b"warm"))
+        if result:
+            crdh.decode_image(result['embedded_img'], manual_peak=result['peak'])
+
+def _report(path, mode):
+    return {'path': path, 'mode': mode, 'status': 'FAIL', 'error': None, 'output': None,
+            'pixels': 0, 'job_ms': None, 'bytes': None, 'peak': None, 'message': None}
+
+def encode_job(path, message_bits, key=None, mask=None, max_layers=1, out_dir=".", fmt='png', png_level=1,
+               sidecar_mode=None):
+    """
+    嵌入一張影像並寫出結果，回傳 job 報告
+    The (peak, zero) plan comes from rdh.plan_embedding; when no one- or
+    two-pair plan fits, greedy layers up to max_layers are tried.
+    `sidecar_mode` is None, 'json' or 'png' (a tEXt chunk when fmt is
+    png, else JSON). Errors are reported in the report, never raised.
+    """
+    report = _report(path, 'encode')
+    start = time.perf_counter()
+    img = output_writer.load_image(path)
+    if img is None:
+        report['error'] = "Failed to load image"
+        return report
+    report['pixels'] = img.shape[0] * img.shape[1]
+
+    # rdh prints debug lines for every step; keep the worker's stdout quiet
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mask is not None and mask.shape != img.shape[:2]:
+            report['error'] = "Mask size does not match the image"
+            return report
+        Y = cv2.cvtColor(img, cv2.COLOR_BGR2YCrCb)[:, :, 0]
+        plane = rdh.region_plane(Y, rdh.mask_region(mask, Y.shape))
+        side_bits = 8 * len(rdh.encode_mask(mask, Y.shape))
+        plan = rdh.plan_embedding(cv2.calcHist([plane], [0], None, [256], [0, 256]), len(message_bits), side_bits)
+        result, error = rdh.embed_message_color(img, message_bits, key=key, max_layers=max_layers, mask=mask,
+                                                plan=plan['pairs'] if plan else None)
+    if error:
+        report['error'] = error
+        return report
+
+    meta = None
+    if sidecar_mode:
+        meta = sidecar.build(result, crdh.bits_to_bytes(message_bits), keyed=key is not None)
+    text = sidecar.png_text(meta) if sidecar_mode == 'png' and fmt == 'png' else None
+    written = output_writer.write_image(result['embedded_img'], output_writer.job_path(out_dir, "batch_embedded", fmt),
+                                        fmt, png_level, text)
+    if meta and text is None and not written['error']:
+        sidecar.write(written['path'], meta)
+    report.update({'output': written['path'], 'bytes': written['bytes'], 'error': written['error'],
+                   'peak': result['peak'], 'status': 'FAIL' if written['error'] else 'OK',
+                   'job_ms': (time.perf_counter() - start) * 1000})
+    return report
+
+def decode_job(path, manual_peak=None, key=None, mask=None, out_dir=".", fmt='png', png_level=1):
+    """解出一張影像的訊息並寫出還原影像，回傳 job 報告"""
+    report = _report(path, 'decode')
+    start = time.perf_counter()
+    img = output_writer.load_image(path)
+    if img is None:
+        report['error'] = "Failed to load image"
+        return report
+    report['pixels'] = img.shape[0] * img.shape[1]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mask is not None and mask.shape != img.shape[:2]:
+            report['error'] = "Mask size does not match the image"
+            return report
+        result, error = crdh.decode_image(img, manual_peak=manual_peak, key=key, mask=mask, sidecar=sidecar.read(path))
+    if error:
+        report['error'] = error
+        return report
+
+    written = output_writer.write_image(result['restored_img'], output_writer.job_path(out_dir, "batch_restored", fmt),
+                                        fmt, png_level)
+    message = result['message'] if result['is_text'] else f"<binary payload, {len(result['payload'])} bytes>"
+    report.update({'output': written['path'], 'bytes': written['bytes'], 'error': written['error'],
+                   'peak': result['extracted_peak'], 'message': message,
+                   'status': 'FAIL' if written['error'] else 'OK',
+                   'job_ms': (time.perf_counter() - start) * 1000})
+    return report
+
+class BatchRunner:
+    """
+    Runs jobs on a process pool that is started on first use and kept for
+    the session. submit() returns the job's future; its result is the job
+    report. Workers are spawned, not forked, so they never inherit the
+    GUI's threads, and each runs `initializer` (warm_worker by default)
+    once; they are reused for every later job until shutdown().
+    """
+
+    def __init__(self, workers=None, initializer=warm_worker):
+        self.workers = workers
+        self.initializer = initializer
+        self.pool = None
+
+    def submit(self, job, *args):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=self.initializer)
+        return self.pool.submit(job, *args)
+
+    def shutdown(self, wait=True):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait, cancel_futures=not wait)
+            self.pool = None
@@ -0,0 +1,101 @@
+# benchmark.py
+# NumPy vs Numba kernels (kernels.py) on one image: embed_data,
+# extract_bits_from_Y_robust and restore_Y_channel, best of N runs each,
+# with the peak extra memory of one run.
+#
+#   python benchmark.py big.png --bits 20000 --repeat 7
+import argparse
+import contextlib
+import io
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import kernels
+import rdh
+import crdh
+
+def _best_ms(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        func()
+        best = min(best, (time.perf_counter_ns() - start) / 1e6)
+    return best
+
+def _peak_bytes(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def cases(Y, n_bits, key=None):
+    """(name, function) per kernel; every function works on its own copy of the inputs"""
+    hist = cv2.calcHist([Y], [0], None, [256], [0, 256])
+    peak = rdh.find_peak(hist)
+    zero = rdh.find_zero_bin(hist, peak)
+    n_bits = min(n_bits, int(hist[peak][0]))
+    bits = ''.join(np.random.default_rng(0).choice(['0', '1'], n_bits))
+    location_map = rdh.build_location_map(Y, peak, zero)
+    with contextlib.redirect_stdout(io.StringIO()):
+        embedded, _ = rdh.embed_data(Y, bits, peak, zero, key)
+    out = np.empty_like(Y)
+    return [
+        ("embed_data (out=)", lambda: rdh.embed_data(Y, bits, peak, zero, key, out=out)),
+        ("extract_bits_from_Y_robust", lambda: crdh.extract_bits_from_Y_robust(embedded, peak, n_bits, key)),
+        ("restore_Y_channel", lambda: crdh.restore_Y_channel(embedded, peak, zero, location_map)),
+    ]
+
+def run(Y, n_bits, key=None, repeat=5):
+    """每個 kernel 在兩條路徑上的最佳時間與峰值記憶體；回傳結果列表"""
+    paths = [False, True] if kernels.HAVE_NUMBA else [False]
+    results = []
+    saved = kernels.USE_NUMBA
+    try:
+        for use_numba in paths:
+            kernels.USE_NUMBA = use_numba
+            for name, func in cases(Y, n_bits, key):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter_ns()
+                    func()  # first call compiles the Numba kernel
+                    first_ms = (time.perf_counter_ns() - start) / 1e6
+                    results.append({
+                        'kernel': name,
+                        'path': 'numba' if use_numba else 'numpy',
+                        'first_ms': first_ms,
+                        'best_ms': _best_ms(func, repeat),
+                        'peak_kb': _peak_bytes(func) / 1024,
+                    })
+    finally:
+        kernels.USE_NUMBA = saved
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the NumPy and Numba kernels of the embed / extract / restore scans")
+    parser.add_argument('image')
+    parser.add_argument('--bits', type=int, default=20000, help="payload bits to embed / extract (capped at the peak size)")
+    parser.add_argument('--key', default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    img = cv2.imread(args.image)
+    if img is None:
+        print(f"Failed to load image: {args.image}")
+        return 1
+    Y = np.ascontiguousarray(cv2.cvtColor(img, cv2.COLOR_BGR2YCrCb)[:, :, 0])
+    if not kernels.HAVE_NUMBA:
+        print("Numba is not installed: only the NumPy path is measured")
+
+    print(f"{Y.shape[1]}x{Y.shape[0]} Y plane ({Y.nbytes / 1024:.0f} KB), best of {args.repeat}")
+    print(f"{'kernel':28} {'path':6} {'first ms':>10} {'best ms':>10} {'peak KB':>10}")
+    for r in run(Y, args.bits, args.key, args.repeat):
+        print(f"{r['kernel']:28} {r['path']:6} {r['first_ms']:10.2f} {r['best_ms']:10.2f} {r['peak_kb']:10.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
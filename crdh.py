@@ -1,13 +1,20 @@
 # crdh.py
+import struct
+import zlib
 import cv2
 import numpy as np
+import rdh
+import kernels
+import profiling
+import sidecar as sidecar_module
 
-def find_original_peak_from_embedded(Y_channel_embedded):
+def find_original_peak_from_embedded(Y_channel_embedded, hist=None):
     """
     Try to find the original peak from the embedded image by analyzing the histogram
     This is a heuristic approach - look for the most likely original peak
     """
-    hist = cv2.calcHist([Y_channel_embedded], [0], None, [256], [0, 256])
+    if hist is None:
+        hist = cv2.calcHist([Y_channel_embedded], [0], None, [256], [0, 256])
     
     # Find peaks in the histogram (local maxima)
     potential_peaks = []
@@ -25,197 +32,538 @@ def find_original_peak_from_embedded(Y_channel_embedded):
         # Fallback to global maximum
         return int(np.argmax(hist))
 
-def extract_bits_from_Y_robust(Y_channel_embedded, original_peak, total_bits_to_extract):
+def scan_plane(Y_channel_embedded, key=None):
+    """
+    依載體掃描順序排列的一維 Y 平面
+    Raster order without a key, else the pixels in rdh.keyed_positions
+    order: the carriers for any peak are then this plane's peak / peak-1
+    pixels from the front, so a header is read from a short prefix.
+    """
+    flat = Y_channel_embedded.ravel()
+    return flat if not key else flat[rdh.keyed_positions(flat.size, key)]
+
+def carrier_bits(plane, peak, count):
+    """The first `count` carrier bits of a scan_plane (fewer when the plane runs out) and the pixels scanned."""
+    carriers, scanned = kernels.find_carriers(plane, peak, count)
+    bits = (plane[carriers] == peak - 1).astype(np.uint8) + ord('0')
+    return bits.tobytes().decode('ascii'), scanned
+
+def extract_bits_from_Y_robust(Y_channel_embedded, original_peak, total_bits_to_extract, key=None):
     """
     Robust bit extraction that handles edge cases better
+    Carriers are the pixels at peak ('0') or peak-1 ('1') in scan order
+    (see scan_plane), the order used by rdh.embed_data. Only the leading
+    part of the scan plane that holds the requested bits is read.
     """
-    bits = ''
-    img_flat = Y_channel_embedded.flatten()
-    extracted_count = 0
-    
-    # Count available pixels for extraction
-    available_peak = np.sum(img_flat == original_peak)
-    available_peak_minus_1 = np.sum(img_flat == original_peak - 1)
-    total_available = available_peak + available_peak_minus_1
-    
-    print(f"[DEBUG] Available pixels: peak({original_peak})={available_peak}, peak-1({original_peak-1})={available_peak_minus_1}, total={total_available}")
-    
-    if total_available < total_bits_to_extract:
-        print(f"警告：可用像素數 ({total_available}) 少於需要提取的位元數 ({total_bits_to_extract})")
-    
-    # Extract bits
-    for i in range(len(img_flat)):
-        if extracted_count >= total_bits_to_extract:
-            break
-        
-        pixel_value = img_flat[i]
-        if pixel_value == original_peak:
-            bits += '0'
-            extracted_count += 1
-        elif pixel_value == original_peak - 1:
-            bits += '1'
-            extracted_count += 1
-    
-    print(f"[DEBUG] Extracted {len(bits)} bits out of {total_bits_to_extract} requested")
+    plane = scan_plane(Y_channel_embedded, key)
+    bits, scanned = carrier_bits(plane, original_peak, total_bits_to_extract)
+    print(f"[DEBUG] Extracted {len(bits)} bits at peak {original_peak} (scanned {scanned}/{len(plane)})")
+    if len(bits) < total_bits_to_extract:
+        print(f"警告：可用像素數 ({len(bits)}) 少於需要提取的位元數 ({total_bits_to_extract})")
     return bits
 
-def bits_to_string(bits):
-    """將位元串轉回原始文字"""
-    if not bits:
-        return ""
-    
-    chars = []
-    # Ensure we have complete bytes
+def parse_header(header_bits):
+    """解析 header：peak | 訊息長度 | zero bin | location map 大小 | layer | 下一層 peak | 遮罩 descriptor 大小 | payload CRC32 | header 檢查碼"""
+    fields = {}
+    offset = 0
+    for name, width in rdh.HEADER_LAYOUT[:-1]:
+        fields[name] = int(header_bits[offset:offset + width], 2)
+        offset += width
+    fields['header_ok'] = int(header_bits[offset:offset + rdh.HEADER_CRC_BITS], 2) == rdh.header_checksum(header_bits[:offset])
+    return fields
+
+def candidate_peaks(Y_channel_embedded, hist=None):
+    """
+    外層 header 的候選 peak：直方圖估計，再依 peak 與 peak-1
+    兩個 bin 的像素數由多到少，只保留至少能放下一個 header 的 bin
+    """
+    if hist is None:
+        hist = cv2.calcHist([Y_channel_embedded], [0], None, [256], [0, 256])
+    carriers = hist.ravel()[1:] + hist.ravel()[:-1]  # carriers[p - 1] = pixels at p and p-1
+    ranked = np.argsort(-carriers, kind='stable') + 1
+    ranked = ranked[carriers[ranked - 1] >= rdh.HEADER_BITS]
+
+    candidates = [find_original_peak_from_embedded(Y_channel_embedded, hist)]
+    candidates.extend(int(p) for p in ranked)
+    return list(dict.fromkeys(candidates))
+
+def read_header(Y_channel_embedded, candidates, key=None, outermost=False):
+    """
+    依序嘗試候選 peak，回傳第一個通過檢查的 header
+    A candidate is dropped as soon as its header does not name that peak
+    or fails the header checksum; no payload is read for it. With
+    `outermost` every candidate is probed and the highest layer wins:
+    an inner layer whose bins lie above the outer layers' peaks is never
+    shifted, so its header still checks out.
+    """
+    # The plane is put in scan order once; each candidate then reads a short prefix
+    plane = scan_plane(Y_channel_embedded, key)
+    found = []
+    for peak in candidates:
+        if not 1 <= peak <= 255:
+            continue
+        header_bits, _ = carrier_bits(plane, peak, rdh.HEADER_BITS)
+        if len(header_bits) < rdh.HEADER_BITS:
+            continue
+        header = parse_header(header_bits)
+        if header['peak'] == peak and header['header_ok']:
+            if not outermost:
+                return header, None
+            found.append(header)
+
+    if found:
+        return max(found, key=lambda h: h['layer']), None
+
+    if len(candidates) == 1:
+        return None, f"錯誤：peak {candidates[0]} 的 Header 檢查碼不符（peak 或金鑰錯誤，或影像已被修改）"
+    return None, f"錯誤：{len(candidates)} 個候選 peak 都沒有通過 Header 檢查（金鑰錯誤或影像已被修改）"
+
+def decode_mask(descriptor, shape):
+    """
+    rdh.encode_mask 的反運算：descriptor -> 遮罩
+    Returns None for an empty descriptor, a list of (x, y, w, h) for
+    rectangles, or a boolean (h, w) array for the transition and bitmap
+    formats, i.e. something mask_region accepts. Raises ValueError on an
+    unknown or corrupt descriptor.
+    """
+    if not descriptor:
+        return None
+    h, w = shape[:2]
+    kind, body = descriptor[:1], descriptor[1:]
+    try:
+        if kind == rdh.MASK_RECTS:
+            count, = struct.unpack('>H', body[:2])
+            return [struct.unpack('>4H', body[2 + 8 * i:10 + 8 * i]) for i in range(count)]
+        if kind == rdh.MASK_BITMAP:
+            bits = np.unpackbits(np.frombuffer(zlib.decompress(body), dtype=np.uint8))
+            return bits[:h * w].reshape(h, w).astype(bool)
+        if kind == rdh.MASK_TRANSITIONS:
+            raw = zlib.decompress(body)
+            counts = np.frombuffer(raw[:2 * h], dtype='>u2').astype(np.int64)
+            deltas = np.frombuffer(raw[2 * h:], dtype='>i2').astype(np.int64)
+            mask = np.zeros((h, w), dtype=bool)
+            start, previous = 0, None
+            for row, count in enumerate(counts):
+                cols = deltas[start:start + count]
+                if previous is not None and len(previous) == count:
+                    cols = cols + previous
+                # Transitions come in (enter, leave) pairs of bitmap columns
+                for x0, x1 in zip(cols[0::2], cols[1::2]):
+                    mask[row, x0:x1] = True
+                start += count
+                previous = cols
+            return mask
+    except (struct.error, zlib.error, ValueError) as e:
+        raise ValueError(f"遮罩 descriptor 損壞：{e}")
+    raise ValueError(f"未知的遮罩 descriptor 類型：{kind!r}")
+
+def bits_to_bytes(bits):
+    """將位元串轉回 bytes（一次 packbits，不逐字元處理）"""
     if len(bits) % 8 != 0:
         print(f"警告：提取的訊息位元數 ({len(bits)}) 不是 8 的倍數，截斷到最近的位元組。")
         bits = bits[:len(bits) - (len(bits) % 8)]
-    
-    for i in range(0, len(bits), 8):
-        byte = bits[i:i+8]
-        if len(byte) == 8:  # Ensure we have a complete byte
-            try:
-                char_code = int(byte, 2)
-                if 32 <= char_code <= 126:  # Printable ASCII range
-                    chars.append(chr(char_code))
-                else:
-                    # Handle non-printable characters
-                    chars.append('?')
-            except ValueError:
-                print(f"警告：無法將位元串 '{byte}' 轉換為字元。")
-                chars.append('?')
-    
-    return ''.join(chars)
+    return np.packbits(rdh.bits_to_array(bits)).tobytes()
 
-def restore_Y_channel(Y_channel_embedded, original_peak):
-    """根據原始 peak 將被修改過的像素值還原"""
-    img_flat = Y_channel_embedded.flatten()
-    restored = img_flat.copy()
-    
-    for i in range(len(restored)):
-        embedded_value = img_flat[i]
-        if embedded_value == original_peak:
-            # This pixel was originally peak and contained data bit '0'
-            pass  # Keep as is
-        elif embedded_value == original_peak - 1:
-            # This pixel was originally peak and contained data bit '1'
-            restored[i] = original_peak
-        elif embedded_value < original_peak - 1:
-            # This pixel was shifted down during embedding
-            restored[i] = embedded_value + 1
-    
+def bits_to_string(bits):
+    """將位元串轉回原始文字（UTF-8；無法解碼的位元組顯示為 U+FFFD）"""
+    return bits_to_bytes(bits).decode('utf-8', errors='replace')
+
+def location_map_bits(location_map):
+    """解壓 location map：每個 zero bin 像素一個 bit（1 = 嵌入前就在 zero bin）"""
+    return np.unpackbits(np.frombuffer(zlib.decompress(location_map), dtype=np.uint8))
+
+def restore_histogram(hist, peak, zero=0, overflow=0):
+    """
+    還原後的直方圖（只用直方圖計算，rdh.shift_histogram 的反運算）
+    Bin peak-1 goes back to the peak, bins (zero, peak-1) move up by one
+    and bin zero splits into the `overflow` pixels that were there before
+    embedding and the ones that came down from zero+1.
+    """
+    hist = np.asarray(hist, dtype=np.float64).ravel()
+    restored = hist.copy()
+    restored[peak] += hist[peak - 1]
+    restored[peak - 1] = 0
+    if zero < peak - 1:
+        restored[zero + 2:peak] = hist[zero + 1:peak - 1]
+        restored[zero + 1] = hist[zero] - overflow
+        restored[zero] = overflow
+    return rdh.as_calc_hist(restored)
+
+def restore_Y_channel(Y_channel_embedded, original_peak, zero=0, location_map=b''):
+    """
+    根據原始 peak 將被修改過的像素值還原
+    Pixels at peak-1 carried a '1' and go back to peak; pixels in
+    [zero, peak-1) were shifted down and go back up by one, except the
+    ones the location map marks as originally at zero.
+    """
+    is_original = location_map_bits(location_map) if location_map else None
+    restored = kernels.restore_plane(Y_channel_embedded.ravel(), original_peak, zero, is_original)
     return restored.reshape(Y_channel_embedded.shape)
 
-def decode_image(img_color, manual_peak=None):
+def decode_layer(Y_channel_embedded, candidates, logs, key=None, mask_descriptor=b'', outermost=False, hist=None, profiler=None,
+                 total_bits=None):
     """
-    Improved decoding function with better error handling
+    解出一層：讀 header、location map 與這一層的訊息位元，並還原 Y
+    `Y_channel_embedded` is the whole plane or the 1-D ROI plane; layer 0
+    stores the mask descriptor, which must match `mask_descriptor`.
+    `candidates` are the peaks to probe for the header (see read_header);
+    `hist` is the plane's histogram if already known. When the layer's
+    size (header included) is known, e.g. from a sidecar, pass it as
+    `total_bits` with a single candidate: header and data are then read
+    in one pass.
+    Returns (layer, error); layer holds the header fields, the message
+    bits of this layer, the restored Y plane (the next layer's input) and
+    its histogram.
     """
-    logs = []
+    profiler = profiler or profiling.StageProfiler(enabled=False)
+    total_header_bits = rdh.HEADER_BITS  # see rdh.build_header
+    full_bits = None
+    if total_bits is not None and len(candidates) == 1:
+        with profiler.stage("extract bits (one pass)"):
+            full_bits = extract_bits_from_Y_robust(Y_channel_embedded, candidates[0], total_bits, key)
+        header = parse_header(full_bits[:total_header_bits]) if len(full_bits) >= total_bits else None
+        if (header is None or header['peak'] != candidates[0] or not header['header_ok']
+                or total_header_bits + 8 * (header['map_size'] + header['mask_size']) + header['length'] != total_bits):
+            return None, f"錯誤：peak {candidates[0]} 的 Header 與 sidecar 不符（金鑰錯誤或影像已被修改）"
+    else:
+        with profiler.stage(f"header probe ({len(candidates)} peaks)"):
+            header, error = read_header(Y_channel_embedded, candidates, key, outermost)
+        if error:
+            return None, error
 
-    try:
-        img_ycrcb = cv2.cvtColor(img_color, cv2.COLOR_BGR2YCrCb)
-        Y_channel_embedded = img_ycrcb[:, :, 0]
+    extracted_peak = header['peak']
+    message_length = header['length']
+    zero = header['zero']
+    map_size = header['map_size']
 
-        # Try multiple approaches to find the original peak
-        hist_embedded = cv2.calcHist([Y_channel_embedded], [0], None, [256], [0, 256])
+    log_msg = (f"從 Header 解析 (layer {header['layer']})：Peak = {extracted_peak}, 訊息長度 = {message_length} bits, "
+               f"Zero bin = {zero}, Location map = {map_size} bytes")
+    print(log_msg)
+    logs.append(log_msg)
 
-        # NEW: Use manual_peak if provided
-        if manual_peak is not None:
-            estimated_peak = manual_peak
-            log_msg = f"使用手動輸入的 peak: {estimated_peak}"
-            print(log_msg)
-            logs.append(log_msg)
-        else:
-            # Approach 1: Use histogram analysis to find likely original peak
-            estimated_peak = find_original_peak_from_embedded(Y_channel_embedded)
-            log_msg = f"估計的原始 peak: {estimated_peak}"
-            print(log_msg)
-            logs.append(log_msg)
+    # Validate extracted values
+    if extracted_peak < 1 or extracted_peak > 255:
+        return None, f"錯誤：提取到的 Peak 值 ({extracted_peak}) 超出有效範圍 [1-255]"
 
-        # Try to extract header with estimated peak
-        total_header_bits = 24  # 8 bits peak + 16 bits length
-        header_bits = extract_bits_from_Y_robust(
-            Y_channel_embedded,
-            original_peak=estimated_peak,
-            total_bits_to_extract=total_header_bits
-        )
-
-        if len(header_bits) < 24:
-            # Try with the global maximum as fallback
-            fallback_peak = int(np.argmax(hist_embedded))
-            log_msg = f"使用備用 peak: {fallback_peak}"
-            print(log_msg)
-            logs.append(log_msg)
+    if zero >= extracted_peak:
+        return None, f"錯誤：提取到的 Zero bin ({zero}) 不在 Peak ({extracted_peak}) 左側"
+
+    if message_length <= 0:
+        return None, f"錯誤：提取到的訊息長度 ({message_length}) 不合理"
 
-            header_bits = extract_bits_from_Y_robust(
+    # Extract full data using the correct peak from header
+    map_end = total_header_bits + map_size * 8
+    payload_start = map_end + header['mask_size'] * 8
+    total_bits_to_extract = payload_start + message_length
+    if full_bits is None:
+        with profiler.stage("extract bits"):
+            full_bits = extract_bits_from_Y_robust(
                 Y_channel_embedded,
-                original_peak=fallback_peak,
-                total_bits_to_extract=total_header_bits
+                original_peak=extracted_peak,
+                total_bits_to_extract=total_bits_to_extract,
+                key=key
             )
-            estimated_peak = fallback_peak
 
-        if len(header_bits) < 24:
-            return None, f"錯誤：無法提取完整的 Header。只提取到 {len(header_bits)} 位元，需要 24 位元。"
+    if len(full_bits) < total_bits_to_extract:
+        return None, f"錯誤：無法提取足夠的資料位元。需要 {total_bits_to_extract}，只得到 {len(full_bits)}"
 
-        # Parse header
-        peak_bits = header_bits[:8]
-        length_bits = header_bits[8:24]
+    if rdh.bits_crc32(full_bits[total_header_bits:]) != header['payload_crc']:
+        return None, f"錯誤：layer {header['layer']} 的資料檢查碼 (CRC32) 不符，影像可能已被修改"
+    message_bits = full_bits[payload_start:]
 
-        extracted_peak = int(peak_bits, 2)
-        message_length = int(length_bits, 2)
+    location_map = bytes(np.packbits(rdh.bits_to_array(full_bits[total_header_bits:map_end])))
+    stored_descriptor = bytes(np.packbits(rdh.bits_to_array(full_bits[map_end:payload_start])))
+    if header['layer'] == 0 and stored_descriptor != mask_descriptor:
+        if not stored_descriptor:
+            return None, "錯誤：此影像沒有使用遮罩嵌入，請勿提供遮罩"
+        return None, "錯誤：提供的遮罩與嵌入時使用的遮罩不符"
 
-        log_msg = f"從 Header 解析：Peak = {extracted_peak}, 訊息長度 = {message_length} bits"
-        print(log_msg)
-        logs.append(log_msg)
-
-        # Validate extracted values
-        if extracted_peak < 0 or extracted_peak > 255:
-            return None, f"錯誤：提取到的 Peak 值 ({extracted_peak}) 超出有效範圍 [0-255]"
-
-        if message_length <= 0 or message_length > 100000:  # Reasonable upper limit
-            return None, f"錯誤：提取到的訊息長度 ({message_length}) 不合理"
-
-        # Extract full data using the correct peak from header
-        total_bits_to_extract = 24 + message_length
-        full_bits = extract_bits_from_Y_robust(
-            Y_channel_embedded,
-            original_peak=extracted_peak,
-            total_bits_to_extract=total_bits_to_extract
-        )
-
-        if len(full_bits) < total_bits_to_extract:
-            # Try partial extraction
-            if len(full_bits) >= 24:
-                message_bits = full_bits[24:]
-                log_msg = f"警告：只能提取部分資料 ({len(message_bits)} bits)，嘗試解碼..."
+    # Restore this layer
+    with profiler.stage("restore Y") as s:
+        restored_Y = restore_Y_channel(Y_channel_embedded, extracted_peak, zero, location_map)
+        s['bytes_copied'] = restored_Y.nbytes
+
+    if hist is None:
+        hist = cv2.calcHist([Y_channel_embedded], [0], None, [256], [0, 256])
+    overflow = int(location_map_bits(location_map)[:int(hist[zero][0])].sum()) if location_map else 0
+
+    header['message_bits'] = message_bits
+    header['restored_Y'] = restored_Y
+    header['hist_restored'] = restore_histogram(hist, extracted_peak, zero, overflow)
+    return header, None
+
+def de_bits(Y_plane, bounds, key=None):
+    """(l, h, changeable, carriers, bits)：DE 平面每個 changeable 像素對差值的 LSB，依 carrier order"""
+    l, h = rdh.de_pairs(Y_plane)
+    _, changeable = rdh.de_classify(l, h, bounds)
+    carriers = np.flatnonzero(changeable)
+    bits = (h[rdh.carrier_order(carriers, len(h), key)] & 1).astype(np.uint8)
+    return l, h, changeable, carriers, bits
+
+def de_header(bits):
+    """DE header；位元不夠、檢查碼不符或不是 DE header 時回傳 None"""
+    if len(bits) < rdh.HEADER_BITS:
+        return None
+    header = parse_header((bits[:rdh.HEADER_BITS] + ord('0')).tobytes().decode('ascii'))
+    return header if header['peak'] == rdh.DE_PEAK and header['header_ok'] else None
+
+def decode_de(Y_plane, logs, key=None, mask_descriptor=b'', img_ycrcb=None, region=None):
+    """
+    解出 difference expansion 嵌入的訊息並還原平面（見 rdh.embed_de_plane）
+    `img_ycrcb` is the embedded image (its chroma gives the pixels' Y
+    ranges) and `region` the ROI indices of Y_plane, if any; without
+    img_ycrcb the plane is treated as gray (0..255). Without a key the
+    header lies in the first changeable pairs, so a plane that is not DE
+    is usually rejected after rdh.DE_PROBE_PIXELS pixels.
+    Returns (layer, error) like decode_layer, or (None, None) when the
+    plane has no difference-expansion header, i.e. it was embedded by
+    histogram shifting.
+    """
+    def bounds(count=None):
+        return None if img_ycrcb is None else rdh.de_bounds(rdh.de_chroma(img_ycrcb, region, count))
+
+    flat_Y = np.ascontiguousarray(Y_plane).ravel()
+    if not key and len(flat_Y) > rdh.DE_PROBE_PIXELS:
+        bits = de_bits(flat_Y[:rdh.DE_PROBE_PIXELS], bounds(rdh.DE_PROBE_PIXELS))[-1]
+        if len(bits) >= rdh.HEADER_BITS and de_header(bits) is None:
+            return None, None
+    l, h, changeable, carriers, bits = de_bits(Y_plane, bounds(), key)
+    header = de_header(bits)
+    if header is None:
+        return None, None
+
+    log_msg = (f"Difference expansion header：訊息長度 = {header['length']} bits, 門檻 T = {header['zero']}, "
+               f"Location map = {header['map_size']} bytes")
+    print(log_msg)
+    logs.append(log_msg)
+
+    map_end = rdh.HEADER_BITS + 8 * header['map_size']
+    lsb_start = map_end + 8 * header['mask_size']
+    try:
+        flags = np.unpackbits(np.frombuffer(zlib.decompress(np.packbits(bits[rdh.HEADER_BITS:map_end]).tobytes()),
+                                            dtype=np.uint8))[:len(carriers)].astype(bool)
+    except zlib.error:
+        flags = None
+    if flags is None or len(flags) < len(carriers):
+        return None, "錯誤：location map 損壞，影像可能已被修改"
+    expanded = np.zeros(len(h), dtype=bool)
+    expanded[carriers] = flags
+    changed = changeable & ~expanded
+    payload_start = lsb_start + int(np.count_nonzero(changed))
+    total = payload_start + header['length']
+    if total > len(bits):
+        return None, f"錯誤：無法提取足夠的資料位元。需要 {total}，只得到 {len(bits)}"
+    if zlib.crc32(np.packbits(bits[rdh.HEADER_BITS:total]).tobytes()) != header['payload_crc']:
+        return None, "錯誤：資料檢查碼 (CRC32) 不符，影像可能已被修改"
+
+    stored_descriptor = np.packbits(bits[map_end:lsb_start]).tobytes()
+    if stored_descriptor != mask_descriptor:
+        if not stored_descriptor:
+            return None, "錯誤：此影像沒有使用遮罩嵌入，請勿提供遮罩"
+        return None, "錯誤：提供的遮罩與嵌入時使用的遮罩不符"
+
+    # Expanded pairs: h = floor(h' / 2); changed pairs get their original LSB back
+    h_orig = h.copy()
+    h_orig[expanded] >>= 1
+    h_orig[changed] = (h[changed] >> 1) * 2 + bits[lsb_start:payload_start]
+    restored_Y = np.array(Y_plane, copy=True)
+    flat = restored_Y.ravel()
+    n = len(h)
+    flat[0:2 * n:2] = l + ((h_orig + 1) >> 1)
+    flat[1:2 * n:2] = l - (h_orig >> 1)
+
+    header['message_bits'] = (bits[payload_start:total] + ord('0')).tobytes().decode('ascii')
+    header['restored_Y'] = restored_Y
+    return header, None
+
+def decode_image(img_color, manual_peak=None, key=None, mask=None, profiler=None, hist=None, sidecar=None):
+    """
+    Improved decoding function with better error handling
+    Layers are peeled off from the outermost one; each header names the
+    peak of the layer below, down to layer 0. Images embedded with a ROI
+    mask need the same mask (rectangles or binary mask) here. Pass a
+    profiling.StageProfiler as `profiler` to time each stage. `hist` is
+    the Y histogram of img_color if already known.
+    A `sidecar` written at embed time (see sidecar.py) names every layer's
+    peak and size, and the mask, so each layer is read in one pass without
+    probing peaks; a manual peak takes precedence over it. If the sidecar
+    does not match the image, decoding falls back to probing.
+    """
+    logs = []
+    profiler = profiler or profiling.StageProfiler(enabled=False)
+    user_mask = mask
+
+    try:
+        with profiler.stage("cvtColor BGR->YCrCb") as s:
+            img_ycrcb = cv2.cvtColor(img_color, cv2.COLOR_BGR2YCrCb)
+            Y_channel_embedded = np.ascontiguousarray(img_ycrcb[:, :, 0])
+            s['bytes_copied'] = img_ycrcb.nbytes + Y_channel_embedded.nbytes
+
+        # Try multiple approaches to find the original peak
+        if hist is None:
+            with profiler.stage("calcHist"):
+                hist = cv2.calcHist([Y_channel_embedded], [0], None, [256], [0, 256])
+        hist_embedded = hist
+
+        planned = None
+        if sidecar is not None and manual_peak is None:
+            problem = sidecar_module.check(sidecar)
+            if problem:
+                log_msg = f"忽略 sidecar：{problem}"
                 print(log_msg)
                 logs.append(log_msg)
+            elif sidecar['keyed'] and key is None:
+                return None, "錯誤：此影像嵌入時使用了金鑰，請輸入金鑰"
             else:
-                return None, f"錯誤：無法提取足夠的資料位元。需要 {total_bits_to_extract}，只得到 {len(full_bits)}"
+                planned = sidecar['layers'][::-1]  # outermost layer first
+                if mask is None:
+                    mask = decode_mask(sidecar_module.mask_descriptor(sidecar), Y_channel_embedded.shape)
+                log_msg = f"使用 sidecar：{len(planned)} 層，最外層 peak = {planned[0]['peak']}"
+                print(log_msg)
+                logs.append(log_msg)
+
+        # Only the allowed region carries data
+        with profiler.stage("mask / region") as s:
+            region = rdh.mask_region(mask, Y_channel_embedded.shape)  # ValueError on a size mismatch
+            mask_descriptor = rdh.encode_mask(mask, Y_channel_embedded.shape)
+            Y_plane = rdh.region_plane(Y_channel_embedded, region)
+            plane_hist = hist_embedded if region is None else cv2.calcHist([Y_plane], [0], None, [256], [0, 256])
+            s['bytes_copied'] = 0 if region is None else Y_plane.nbytes
+
+        # Difference-expansion images announce themselves with a DE header.
+        # Without a key it sits in the first pixels and is probed first; with
+        # a key finding it costs a full pass over the pair plane, so it is
+        # only probed once no histogram-shifting header is found
+        de_layer = None
+        probe_de = manual_peak is None and not planned
+        if probe_de and not key:
+            with profiler.stage("difference expansion probe"):
+                de_layer, error = decode_de(Y_plane, logs, key, mask_descriptor, img_ycrcb, region)
+            if error:
+                return None, error
+
+        # NEW: Use manual_peak if provided
+        if de_layer is not None:
+            candidates = []
+        elif manual_peak is not None:
+            log_msg = f"使用手動輸入的 peak: {manual_peak}"
+            print(log_msg)
+            logs.append(log_msg)
+            candidates = [manual_peak]
+            # A peak that names an inner layer would decode only that layer and
+            # the ones below it, i.e. part of the message
+            header, _ = read_header(Y_plane, candidates, key)
+            if header is not None:
+                outer, _ = read_header(Y_plane, candidate_peaks(Y_plane, plane_hist), key, outermost=True)
+                if outer is not None and outer['layer'] > header['layer']:
+                    return None, (f"錯誤：peak {manual_peak} 是第 {header['layer']} 層，影像還有外層"
+                                  f"（最外層 peak = {outer['peak']}）；請輸入最外層的 peak")
+        elif planned:
+            candidates = [planned[0]['peak']]
         else:
-            message_bits = full_bits[24:24+message_length]
+            # No peak given: probe the likely bins for the outermost layer's header
+            candidates = candidate_peaks(Y_plane, plane_hist)
+
+        # Peel the layers off in reverse embedding order
+        chunks = []
+        pairs = []
+        restored_Y = Y_plane
+        restored_hist = plane_hist
+        extracted_peak = None
+        while de_layer is None:
+            if planned and len(chunks) >= len(planned):
+                return None, f"錯誤：sidecar 只記錄了 {len(planned)} 層，影像還有更多層"
+            with profiler.stage(f"layer {len(chunks)} (from outside)"):
+                layer, error = decode_layer(restored_Y, candidates, logs, key, mask_descriptor,
+                                            outermost=not chunks and manual_peak is None, hist=restored_hist,
+                                            profiler=profiler, total_bits=planned[len(chunks)]['bits'] if planned else None)
+            if error and planned and not chunks:
+                # Stale or foreign sidecar: decode as if there were none
+                result, error = decode_image(img_color, manual_peak, key, user_mask, profiler, hist_embedded)
+                if result:
+                    result['logs'].insert(0, "sidecar 與影像不符，改用 peak 偵測")
+                return result, error
+            if error and probe_de and key and not chunks:
+                with profiler.stage("difference expansion probe"):
+                    de_layer, de_error = decode_de(Y_plane, logs, key, mask_descriptor, img_ycrcb, region)
+                if de_layer is not None:
+                    break
+                error = de_error or error
+            if error:
+                return None, error
+            if chunks and layer['layer'] != expected_layer:
+                return None, f"錯誤：layer 順序不正確（預期 {expected_layer}，得到 {layer['layer']}）"
+            if extracted_peak is None:
+                extracted_peak = layer['peak']
+                zero = layer['zero']
+                if manual_peak is None:
+                    log_msg = f"Header 檢查通過的 peak: {extracted_peak}"
+                    print(log_msg)
+                    logs.append(log_msg)
+            chunks.append(layer['message_bits'])
+            pairs.append((layer['peak'], layer['zero']))
+            restored_Y = layer['restored_Y']
+            restored_hist = layer['hist_restored']
+            if layer['layer'] == 0:
+                break
+            expected_layer = layer['layer'] - 1
+            candidates = [layer['next_peak']]
+        if de_layer is not None:
+            chunks = [de_layer['message_bits']]
+            restored_Y = de_layer['restored_Y']
+            restored_hist = cv2.calcHist([restored_Y], [0], None, [256], [0, 256])
+            extracted_peak, zero = rdh.DE_PEAK, de_layer['zero']
 
-        # Decode message
-        message = bits_to_string(message_bits)
+        message_bits = ''.join(reversed(chunks))
+        if len(chunks) > 1:
+            log_msg = f"共解出 {len(chunks)} 層"
+            print(log_msg)
+            logs.append(log_msg)
+
+        # Decode message: the payload is raw bytes, shown as UTF-8 text when it is text
+        with profiler.stage("pack payload"):
+            payload = bits_to_bytes(message_bits)
+        if planned and zlib.crc32(payload) != sidecar['payload_crc32']:
+            log_msg = "警告：訊息的 CRC32 與 sidecar 記錄的不同"
+            print(log_msg)
+            logs.append(log_msg)
+        try:
+            message = payload.decode('utf-8')
+            is_text = True
+        except UnicodeDecodeError:
+            message = payload.decode('utf-8', errors='replace')
+            is_text = False
         log_msg = f"解碼訊息: '{message}'"
         print(log_msg)
 
         # Restore image
-        restored_Y = restore_Y_channel(Y_channel_embedded, extracted_peak)
-        restored_Y = np.clip(restored_Y, 0, 255).astype(np.uint8)
+        if region is not None:
+            restored_plane = restored_Y
+            restored_Y = Y_channel_embedded.copy()
+            restored_Y.ravel()[region] = restored_plane
 
-        Cr = img_ycrcb[:, :, 1]
-        Cb = img_ycrcb[:, :, 2]
-        restored_ycrcb = cv2.merge([restored_Y, Cr, Cb])
-        restored_img = cv2.cvtColor(restored_ycrcb, cv2.COLOR_YCrCb2BGR)
+        with profiler.stage("merge + cvtColor YCrCb->BGR") as s:
+            Cr = img_ycrcb[:, :, 1]
+            Cb = img_ycrcb[:, :, 2]
+            restored_ycrcb = cv2.merge([restored_Y, Cr, Cb])
+            restored_img = cv2.cvtColor(restored_ycrcb, cv2.COLOR_YCrCb2BGR)
+            s['bytes_copied'] = restored_ycrcb.nbytes + restored_img.nbytes
 
-        hist_restored = cv2.calcHist([restored_Y], [0], None, [256], [0, 256])
+        # Pixels outside the region were never touched
+        hist_restored = hist_embedded - plane_hist + restored_hist
 
         return {
             'message': message,
+            'payload': payload,
+            'is_text': is_text,
             'restored_img': restored_img,
             'hist_embedded': hist_embedded,
             'hist_restored': hist_restored,
             'extracted_peak': extracted_peak,
+            'zero': zero,
+            'layers': len(chunks),
+            'method': 'hs' if de_layer is None else 'de',
+            'pairs': pairs[::-1],  # (peak, zero) per layer, embedding order
             'logs': logs
         }, None
 
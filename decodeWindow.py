@@ -4,6 +4,7 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPixmap
 
 from histogram_widget import HistogramWidget
+from encodeWindow import DraggableLabel
 
 class DecodeWindow(QFrame):
     def __init__(self, parent=None):
@@ -28,7 +29,8 @@ class DecodeWindow(QFrame):
         input_layout.setSpacing(20)
         input_layout.setAlignment(Qt.AlignTop)
 
-        self.dec_image_preview = QLabel(".. or Drop images here")
+        self.dec_image_preview = DraggableLabel(self, 'decoding')
+        self.dec_image_preview.setText(".. or Drop images here")
         self.dec_image_preview.setFixedSize(280, 280)
         self.dec_image_preview.setStyleSheet("""
             border: 2px dashed rgba(230, 230, 230, 0.9);
@@ -59,7 +61,20 @@ class DecodeWindow(QFrame):
             }
         """)
         self.dec_select_btn.clicked.connect(lambda: self.parent.select_image('decoding'))
-        input_layout.addWidget(self.dec_select_btn, alignment=Qt.AlignCenter)
+
+        # ROI mask used at encoding time (if any)
+        self.dec_mask_btn = QPushButton("Mask")
+        self.dec_mask_btn.setFixedSize(90, 40)
+        self.dec_mask_btn.setStyleSheet(self.dec_select_btn.styleSheet())
+        self.dec_mask_btn.clicked.connect(lambda: self.parent.select_mask('decoding'))
+
+        select_row = QHBoxLayout()
+        select_row.setSpacing(10)
+        select_row.addStretch()
+        select_row.addWidget(self.dec_select_btn)
+        select_row.addWidget(self.dec_mask_btn)
+        select_row.addStretch()
+        input_layout.addLayout(select_row)
 
         input_layout.addItem(QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding))
 
@@ -78,6 +93,22 @@ class DecodeWindow(QFrame):
         """)
         input_layout.addWidget(self.dec_input_box, alignment=Qt.AlignCenter)
 
+        # Secret key used at encoding time (if any)
+        self.dec_key_box = QLineEdit()
+        self.dec_key_box.setPlaceholderText("Secret key (optional)")
+        self.dec_key_box.setEchoMode(QLineEdit.Password)
+        self.dec_key_box.setFixedSize(250, 35)
+        self.dec_key_box.setStyleSheet("""
+            background-color: rgba(60, 40, 40, 0.7);
+            border: 1px solid rgba(230, 230, 230, 0.9);
+            border-radius: 8px;
+            font-size: 15px;
+            font-family: 'Comic Sans MS';
+            color: rgba(230, 230, 230, 0.9);
+            padding-left: 10px;
+        """)
+        input_layout.addWidget(self.dec_key_box, alignment=Qt.AlignCenter)
+
         # Run button
         self.dec_run_btn = QPushButton("Run")
         self.dec_run_btn.setFixedSize(200, 40)
@@ -1,20 +1,21 @@
 ﻿# encodeWindow.py
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap
 import os
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
 import rdh
+from image_io import IMAGE_EXTENSIONS
 from histogram_widget import HistogramWidget
 
 
 #draggable Qlabel
 class DraggableLabel(QLabel):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, mode='encoding'):
         super().__init__(parent)
         self.parent = parent
+        self.mode = mode
         self.setAcceptDrops(True)
 
     def dragEnterEvent(self, event):
@@ -24,19 +25,15 @@ class DraggableLabel(QLabel):
             event.ignore()
 
     def dropEvent(self, event):
-        if event.mimeData().hasUrls():
-            file_path = event.mimeData().urls()[0].toLocalFile()
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-                pixmap = QPixmap(file_path)
-                self.setPixmap(pixmap.scaled(
-                    self.width(),
-                    self.height(),
-                    Qt.KeepAspectRatio,
-                    Qt.SmoothTransformation
-                ))
-                # 把檔案路徑傳給 parent 紀錄
-                if self.parent:
-                    self.parent.parent.current_encoding_image_path = file_path
+        if event.mimeData().hasUrls() and self.parent:
+            paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+            main = self.parent.parent
+            if len(paths) == 1 and paths[0].lower().endswith(IMAGE_EXTENSIONS):
+                # 單張影像：當作目前的輸入
+                main.set_input_image(paths[0], self.mode)
+            else:
+                # 多個檔案或資料夾：排進批次佇列
+                main.enqueue_batch(paths, self.mode)
 
 
 class EncodeWindow(QFrame):
@@ -59,11 +56,11 @@ class EncodeWindow(QFrame):
         input_panel = QFrame()
         input_panel.setStyleSheet("background-color: transparent;")
         input_layout = QVBoxLayout()
-        input_layout.setSpacing(15)
+        input_layout.setSpacing(10)
         input_layout.setAlignment(Qt.AlignTop)
 
         #image drop and display box
-        self.enc_image_preview = DraggableLabel(self)
+        self.enc_image_preview = DraggableLabel(self, 'encoding')
         self.enc_image_preview.setText(".. or Drop images here")
         self.enc_image_preview.setFixedSize(300, 300)
         self.enc_image_preview.setAlignment(Qt.AlignCenter)
@@ -94,7 +91,20 @@ class EncodeWindow(QFrame):
             }
         """)
         self.enc_select_btn.clicked.connect(lambda: self.parent.select_image('encoding'))
-        input_layout.addWidget(self.enc_select_btn, alignment=Qt.AlignCenter)
+
+        #optional ROI mask: only the white pixels of the mask image are touched
+        self.enc_mask_btn = QPushButton("Mask")
+        self.enc_mask_btn.setFixedSize(90, 40)
+        self.enc_mask_btn.setStyleSheet(self.enc_select_btn.styleSheet())
+        self.enc_mask_btn.clicked.connect(lambda: self.parent.select_mask('encoding'))
+
+        select_row = QHBoxLayout()
+        select_row.setSpacing(10)
+        select_row.addStretch()
+        select_row.addWidget(self.enc_select_btn)
+        select_row.addWidget(self.enc_mask_btn)
+        select_row.addStretch()
+        input_layout.addLayout(select_row)
 
         #QLineEdit obj to input encode message
         self.enc_textbox = QLineEdit()
@@ -111,6 +121,22 @@ class EncodeWindow(QFrame):
         """)
         input_layout.addWidget(self.enc_textbox, alignment=Qt.AlignCenter)
 
+        #optional secret key: scrambles which pixels carry the bits
+        self.enc_key_box = QLineEdit()
+        self.enc_key_box.setPlaceholderText("Secret key (optional)")
+        self.enc_key_box.setEchoMode(QLineEdit.Password)
+        self.enc_key_box.setFixedSize(300, 40)
+        self.enc_key_box.setStyleSheet("""
+            font-size:16px;
+            font-family:'Comic Sans MS';
+            border: 1px solid rgba(255, 105, 180, 0.9);
+            border-radius: 8px;
+            padding: 5px 10px;
+            background-color: rgba(50, 0, 0, 0.85);
+            color: #fff;
+        """)
+        input_layout.addWidget(self.enc_key_box, alignment=Qt.AlignCenter)
+
         #run button
         self.enc_run_btn = QPushButton("Run")
         self.enc_run_btn.setFixedSize(200, 40)
@@ -185,6 +211,7 @@ class EncodeWindow(QFrame):
 
     def run_encoding(self):
         self.parent.enc_textbox = self.enc_textbox
+        self.parent.enc_key_box = self.enc_key_box
         self.parent.enc_image_preview = self.enc_image_preview
         self.parent.enc_encoded_image = self.enc_encoded_image
         self.parent.enc_histograms = self.enc_histograms
@@ -1,7 +1,7 @@
 # histogram_widget.py
 from PyQt5.QtWidgets import QWidget
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPainter, QPen, QColor, QFont
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import QPainter, QPen, QColor, QFont, QPixmap
 import numpy as np
 
 class HistogramWidget(QWidget):
@@ -15,24 +15,64 @@ class HistogramWidget(QWidget):
         self.setMinimumSize(400, 200)
         self.setAttribute(Qt.WA_TranslucentBackground)
 
+        # Bar geometry (normalized) and the pre-rendered picture of the whole plot
+        self.bar_indices = None
+        self.bar_heights = None
+        self._cache = None
+
     def set_histogram_data(self, hist_data, title="Histogram", color=None, peak=None):
         self.histogram_data = hist_data.flatten() if hist_data is not None else None
         self.title = title
         if color:
             self.color = color
         self.peak_value = peak
+
+        # Compute bar geometry once: non-empty bins and their heights relative to the max
+        if self.histogram_data is not None and len(self.histogram_data) > 0:
+            data = np.asarray(self.histogram_data, dtype=np.float64)
+            maxv = data.max()
+            self.bar_indices = np.flatnonzero(data > 0)
+            self.bar_heights = data[self.bar_indices] / maxv if maxv > 0 else np.zeros(0)
+        else:
+            self.bar_indices = None
+            self.bar_heights = None
+
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        """Drop the cached rendering and schedule a repaint."""
+        self._cache = None
         self.update()  #trigger repaint
 
-    def paintEvent(self, event):
-        pink = (255, 105, 150)
-        red = (80, 0, 0, 153)
-        gold = (255, 215, 0) 
+    def resizeEvent(self, event):
+        self._cache = None
+        super().resizeEvent(event)
 
+    def paintEvent(self, event):
         # === FIXED GUARD ===
         if self.histogram_data is None or len(self.histogram_data) == 0:
             return
 
+        if self._cache is None:
+            self._cache = self.render_histogram()
+
+        # Repaints (window drags, dashboard ticks) are a single blit of the cached plot
         painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._cache)
+        painter.end()
+
+    def render_histogram(self):
+        """Render bars, grid, labels and border into a transparent QPixmap."""
+        pink = (255, 105, 150)
+        red = (80, 0, 0, 153)
+        gold = (255, 215, 0) 
+
+        ratio = self.devicePixelRatioF()
+        pixmap = QPixmap(self.size() * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.transparent)
+
+        painter = QPainter(pixmap)
         painter.setRenderHint(QPainter.Antialiasing)
 
         w, h = self.width(), self.height()
@@ -49,23 +89,26 @@ class HistogramWidget(QWidget):
             border_color = QColor(235, 106, 181)  # Pink border
             title_color = QColor(235, 106, 181)   # Pink title
 
-        # Draw bars
-        maxv = np.max(self.histogram_data)
+        # Draw bars: geometry for all bins at once, then one fill call per color
         bar_w = plot_w / len(self.histogram_data)
+        ph = self.bar_heights * plot_h
+        rects = np.stack([
+            ml + self.bar_indices * bar_w,
+            mt + (plot_h - ph),
+            np.full(len(ph), bar_w),
+            ph,
+        ], axis=1).astype(int)
 
-        for i, v in enumerate(self.histogram_data):
-            if v <= 0:
-                continue
-            ph = (v / maxv) * plot_h
-            x = ml + i * bar_w
-            y = mt + (plot_h - ph)
-            if i == self.peak_value:
-                col = QColor(*gold, 220)
-            elif hasattr(self, 'shifted_indices') and i in self.shifted_indices:
-                col = QColor(*base_color, 180) if len(base_color) == 3 else QColor(*base_color)
-            else:
-                col = QColor(*base_color, 180) if len(base_color) == 3 else QColor(*base_color)
-            painter.fillRect(int(x), int(y), int(bar_w), int(ph), col)
+        is_peak = self.bar_indices == self.peak_value
+        base_rects = [QRect(*r) for r in rects[~is_peak].tolist()]
+        peak_rects = [QRect(*r) for r in rects[is_peak].tolist()]
+
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(*base_color, 180) if len(base_color) == 3 else QColor(*base_color))
+        painter.drawRects(base_rects)
+        painter.setBrush(QColor(*gold, 220))
+        painter.drawRects(peak_rects)
+        painter.setBrush(Qt.NoBrush)
 
         # Draw grid
         pen = QPen(QColor(60, 60, 60), 1)
@@ -103,4 +146,7 @@ class HistogramWidget(QWidget):
         # Border (white in decode mode)
         dash_pen = QPen(border_color, 2, Qt.DashLine)
         painter.setPen(dash_pen)
-        painter.drawRoundedRect(1, 1, w - 2, h - 2, 5, 5)
\ No newline at end of file
+        painter.drawRoundedRect(1, 1, w - 2, h - 2, 5, 5)
+
+        painter.end()
+        return pixmap
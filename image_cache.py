@@ -0,0 +1,87 @@
+# image_cache.py
+# Session cache of input images: the BGR array, its contiguous Y plane and
+# the Y histogram, so re-running with another message / key / peak, or
+# decoding the image just embedded, does no disk I/O and no re-conversion.
+import os
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import output_writer
+
+IMAGE_CACHE_BYTES = 256 * 1024 * 1024  # default byte limit (arrays only)
+
+def file_mtime(path):
+    """修改時間；檔案不存在或無法讀取時回傳 None"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+class ImageCache:
+    """
+    LRU by total array bytes; the most recently used image is always kept,
+    even when it alone is over the limit. Like thumbnails.ThumbnailCache,
+    an array registered with put_array is trusted as is, and an image
+    loaded from disk is reloaded when the file's modification time changes.
+    Cached arrays are read-only: callers must copy before modifying.
+    """
+
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()  # path -> {'mtime', 'img', 'Y', 'hist'}, LRU order
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._entries
+
+    def put_array(self, path, img, mtime=None):
+        """登錄記憶體中的影像（不讀檔），例如剛嵌入、還在背景寫檔的結果"""
+        key = os.path.abspath(path)
+        self._drop(key)
+        img.flags.writeable = False
+        self._entries[key] = {'mtime': mtime, 'img': img, 'Y': None, 'hist': None}
+        self.nbytes += img.nbytes
+        self._evict()
+
+    def get(self, path):
+        """取得 BGR 影像；沒有快取（或檔案已改變）時從檔案讀一次，失敗回傳 None"""
+        entry = self._entry(path)
+        return None if entry is None else entry['img']
+
+    def planes(self, path):
+        """(Y, hist)：連續的 Y 平面與其直方圖，第一次使用時才計算；讀檔失敗回傳 (None, None)"""
+        entry = self._entry(path)
+        if entry is None:
+            return None, None
+        if entry['Y'] is None:
+            Y = np.ascontiguousarray(cv2.cvtColor(entry['img'], cv2.COLOR_BGR2YCrCb)[:, :, 0])
+            Y.flags.writeable = False
+            entry['Y'] = Y
+            entry['hist'] = cv2.calcHist([Y], [0], None, [256], [0, 256])
+            self.nbytes += Y.nbytes + entry['hist'].nbytes
+            self._evict()
+        return entry['Y'], entry['hist']
+
+    def _entry(self, path):
+        key = os.path.abspath(path)
+        entry = self._entries.get(key)
+        if entry is None or (entry['mtime'] is not None and entry['mtime'] != file_mtime(key)):
+            img = output_writer.load_image(key)
+            if img is None:
+                self._drop(key)
+                return None
+            self.put_array(key, img, file_mtime(key))
+            entry = self._entries[key]
+        self._entries.move_to_end(key)
+        return entry
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= sum(entry[k].nbytes for k in ('img', 'Y', 'hist') if entry[k] is not None)
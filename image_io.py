@@ -0,0 +1,22 @@
+# image_io.py
+# Input helpers shared by the GUI and the command-line tools (audit.py,
+# verify.py): which files count as images, expanding files and folders
+# into image paths, and parsing ROI rectangles.
+import os
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp', '.npy')
+
+def collect_images(inputs):
+    """展開輸入的檔案與資料夾，回傳排序後的影像路徑"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+        elif item.lower().endswith(IMAGE_EXTENSIONS):
+            paths.append(item)
+    return sorted(paths)
+
+def parse_rects(text):
+    """'x,y,w,h;x,y,w,h' -> [(x, y, w, h), ...]"""
+    return [tuple(int(v) for v in part.split(',')) for part in text.split(';') if part.strip()]
@@ -0,0 +1,87 @@
+# job_queue_widget.py
+from PyQt5.QtWidgets import QFrame, QLabel, QListWidget, QListWidgetItem, QVBoxLayout, QAbstractItemView
+from PyQt5.QtGui import QColor
+import os
+
+STATUS_COLORS = {'queued': QColor(160, 160, 160), 'OK': QColor(0, 255, 0), 'FAIL': QColor(255, 80, 80)}
+
+class JobQueueWidget(QFrame):
+    """Batch job list: one row per dropped image with its status, and a throughput line on top."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.setAcceptDrops(True)
+        self.setStyleSheet("""
+            background-color: rgba(0, 0, 0, 130);
+            border-radius: 3px;
+        """)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(8, 8, 8, 8)
+        layout.setSpacing(6)
+
+        self.summary_label = QLabel("Drop images or folders here to batch")
+        self.summary_label.setWordWrap(True)
+        self.summary_label.setStyleSheet("""
+            font-size: 13px;
+            font-family: 'Comic Sans MS';
+            color: rgba(255, 105, 180, 0.9);
+            background-color: transparent;
+        """)
+        layout.addWidget(self.summary_label)
+
+        self.job_list = QListWidget()
+        self.job_list.setSelectionMode(QAbstractItemView.NoSelection)
+        self.job_list.setUniformItemSizes(True)  # rows never change height, so long queues scroll cheaply
+        self.job_list.setStyleSheet("""
+            font-size: 12px;
+            font-family: 'Courier New';
+            color: #00FF00;
+            background-color: transparent;
+            border: none;
+        """)
+        layout.addWidget(self.job_list)
+        self.setLayout(layout)
+
+    def add_job(self, path, mode):
+        """新增一列（queued），回傳列號"""
+        item = QListWidgetItem(f"{mode[:3]} {os.path.basename(path)}  queued")
+        item.setForeground(STATUS_COLORS['queued'])
+        item.setToolTip(path)
+        self.job_list.addItem(item)
+        return self.job_list.count() - 1
+
+    def set_status(self, row, report):
+        """依 job 報告更新一列"""
+        item = self.job_list.item(row)
+        if item is None:
+            return
+        name = os.path.basename(report['path'])
+        if report['status'] == 'OK':
+            text = f"{report['mode'][:3]} {name}  OK {report['job_ms']:.0f} ms"
+            if report['peak'] is not None:
+                text += f", peak {report['peak']}"
+        else:
+            text = f"{report['mode'][:3]} {name}  FAIL"
+            item.setToolTip(f"{report['path']}\n{report['error']}")
+        item.setText(text)
+        item.setForeground(STATUS_COLORS[report['status']])
+
+    def set_summary(self, text):
+        self.summary_label.setText(text)
+
+    def clear_jobs(self):
+        self.job_list.clear()
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+        else:
+            event.ignore()
+
+    def dropEvent(self, event):
+        # Dropped on the queue itself: jobs follow the current mode
+        if event.mimeData().hasUrls() and self.parent:
+            paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+            self.parent.enqueue_batch(paths, 'encoding' if self.parent.is_encoding else 'decoding')
@@ -0,0 +1,171 @@
+# kernels.py
+# Per-pixel scans of embedding, extraction and restoration. With Numba
+# installed each one is a compiled loop over the plane that allocates
+# nothing plane-sized; without it (or with RDH_NO_NUMBA=1) the
+# same functions run the NumPy version, so callers never branch.
+import os
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Pixels scanned first when probing without a limit-aware kernel (grown 4x until enough carriers)
+PROBE_PIXELS = 4096
+
+HAVE_NUMBA = numba is not None
+USE_NUMBA = HAVE_NUMBA and not os.environ.get('RDH_NO_NUMBA')  # benchmark.py flips this to compare
+
+def _jit(func):
+    return numba.njit(cache=True, nogil=True)(func) if HAVE_NUMBA else None
+
+# ---------- compiled kernels ----------
+
+def _collect_and_shift(flat, peak, zero, needed):
+    count = 0
+    for i in range(flat.size):
+        count += flat[i] == peak
+    carriers = np.empty(count, np.int64)
+    j = 0
+    for i in range(flat.size):
+        if flat[i] == peak:
+            carriers[j] = i
+            j += 1
+    if count < needed:
+        return carriers, 0  # not enough room: leave the plane as it was
+    # Branch-free so LLVM vectorizes it: zero < v < peak  <=>  (v - zero - 1) mod 256 < peak - zero - 1
+    low = np.uint8(zero + 1)
+    span = np.uint8(peak - zero - 1)
+    shifted = 0
+    for i in range(flat.size):
+        v = flat[i]
+        s = np.uint8(v - low) < span
+        flat[i] = v - np.uint8(s)
+        shifted += s
+    return carriers, shifted
+
+def _find_carriers(flat, peak, limit):
+    # First pass counts up to `limit` carriers and remembers where it stopped
+    count = 0
+    end = flat.size
+    for i in range(flat.size):
+        v = flat[i]
+        if v == peak or v == peak - 1:
+            count += 1
+            if count == limit:
+                end = i + 1
+                break
+    carriers = np.empty(count, np.int64)
+    j = 0
+    for i in range(end):
+        v = flat[i]
+        if v == peak or v == peak - 1:
+            carriers[j] = i
+            j += 1
+    return carriers, end
+
+def _restore(flat, out, peak, zero, is_original, use_map):
+    seen = 0  # zero-bin pixels met so far (index into the location map)
+    for i in range(flat.size):
+        v = flat[i]
+        if v == peak - 1:
+            out[i] = peak
+        elif zero <= v < peak - 1:
+            if v == zero and use_map:
+                if seen >= is_original.size:
+                    return -1
+                out[i] = zero if is_original[seen] else zero + 1
+                seen += 1
+            else:
+                out[i] = v + 1
+        else:
+            out[i] = v
+    return seen
+
+_collect_and_shift_jit = _jit(_collect_and_shift)
+_find_carriers_jit = _jit(_find_carriers)
+_restore_jit = _jit(_restore)
+
+# ---------- public API ----------
+
+def collect_and_shift(flat, peak, zero, needed=0):
+    """
+    找出 peak 像素並把 (zero, peak) 的像素下移一格（就地修改 flat）
+    `flat` is a 1-D uint8 view that is written in place. Returns
+    (carriers, shifted): the indices of the peak pixels in raster order
+    and the number of pixels moved down. When there are fewer than
+    `needed` peak pixels, flat is left untouched and shifted is 0.
+    The NumPy version needs one uint8 scratch plane.
+    """
+    if USE_NUMBA:
+        return _collect_and_shift_jit(flat, np.uint8(peak), np.uint8(zero), needed)
+
+    # One scratch plane, used as a boolean mask and then as the 0/1 shift amount
+    scratch = np.empty_like(flat)
+    is_set = scratch.view(np.bool_)
+    np.equal(flat, peak, out=is_set)
+    carriers = np.flatnonzero(is_set)
+    if len(carriers) < needed:
+        return carriers, 0
+
+    # zero < v < peak  <=>  (v - zero - 1) mod 256 < peak - zero - 1
+    np.subtract(flat, np.uint8(zero + 1), out=scratch)
+    np.less(scratch, np.uint8(peak - zero - 1), out=is_set)
+    shifted = np.count_nonzero(is_set)
+    np.subtract(flat, scratch, out=flat)
+    return carriers, shifted
+
+def find_carriers(flat, peak, limit=None):
+    """
+    peak / peak-1 像素（raster order）
+    Returns (carriers, scanned). With a `limit` the scan stops once that
+    many carriers are found, so probing a header reads a few thousand
+    pixels, not the whole plane; the NumPy version grows a scanned prefix
+    4x at a time instead.
+    """
+    if USE_NUMBA:
+        return _find_carriers_jit(flat, np.uint8(peak), -1 if limit is None else limit)
+
+    is_carrier = lambda values: (values == peak) | (values == peak - 1)
+    if limit is None:
+        return np.flatnonzero(is_carrier(flat)), len(flat)
+    end = max(PROBE_PIXELS, 8 * limit)
+    while True:
+        carriers = np.flatnonzero(is_carrier(flat[:end]))
+        if len(carriers) >= limit or end >= len(flat):
+            break
+        end *= 4
+    return carriers[:limit], min(end, len(flat))
+
+def restore_plane(flat, peak, zero=0, is_original=None):
+    """
+    還原一個平面：peak-1 -> peak，[zero, peak-1) 上移一格
+    except the zero-bin pixels that `is_original` (the unpacked location
+    map, one entry per zero-bin pixel in raster order) marks as
+    originally at zero. `flat` is only read; returns a new 1-D array.
+    Raises ValueError when the location map is too short.
+    """
+    if USE_NUMBA:
+        restored = np.empty_like(flat)
+        use_map = is_original is not None
+        seen = _restore_jit(flat, restored, np.uint8(peak), np.uint8(zero),
+                            is_original if use_map else np.empty(0, np.uint8), use_map)
+        if seen < 0:
+            raise ValueError(f"location map 太短：{len(is_original)} bits，需要 {np.count_nonzero(flat == zero)} bits")
+        return restored
+
+    restored = flat.copy()
+
+    # Pixels in bin `zero` that were there before embedding (overflow pixels)
+    zero_idx = np.flatnonzero(flat == zero) if is_original is not None else None
+
+    restored[(flat >= zero) & (flat < peak - 1)] += 1
+    restored[flat == peak - 1] = peak
+
+    if is_original is not None:
+        if len(is_original) < len(zero_idx):
+            raise ValueError(f"location map 太短：{len(is_original)} bits，需要 {len(zero_idx)} bits")
+        restored[zero_idx[is_original[:len(zero_idx)] == 1]] = zero
+    return restored
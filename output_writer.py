@@ -0,0 +1,134 @@
+# output_writer.py
+# Lossless output stage: encode images as PNG / TIFF / WebP-lossless / NPY
+# on a background thread pool, one unique file per job.
+import os
+import struct
+import time
+import uuid
+import zlib
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Every format here keeps the pixels bit-exact, which the decoder relies on
+OUTPUT_FORMATS = {
+    'png': '.png',
+    'tiff': '.tiff',
+    'webp': '.webp',
+    'npy': '.npy',
+}
+DEFAULT_PNG_LEVEL = 3       # cv2 default; 0 = fastest / largest, 9 = smallest / slowest
+TIFF_LZW = 5                # libtiff compression tag for LZW
+WEBP_LOSSLESS_QUALITY = 101  # quality above 100 selects lossless WebP in OpenCV
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def encode_params(fmt, png_level=DEFAULT_PNG_LEVEL):
+    """cv2.imwrite 參數"""
+    if fmt == 'png':
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_level)]
+    if fmt == 'tiff':
+        return [cv2.IMWRITE_TIFF_COMPRESSION, TIFF_LZW]
+    if fmt == 'webp':
+        return [cv2.IMWRITE_WEBP_QUALITY, WEBP_LOSSLESS_QUALITY]
+    raise ValueError(f"Unsupported output format: {fmt}")
+
+def job_path(out_dir, prefix, fmt):
+    """每個 job 一個不重複的路徑：<prefix>_<time>_<id>.<ext>（fmt 也可以是其他副檔名，如 'json'）"""
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(out_dir, f"{prefix}_{stamp}_{uuid.uuid4().hex[:8]}{OUTPUT_FORMATS.get(fmt, '.' + fmt)}")
+
+def add_png_text(data, keyword, text):
+    """在 PNG 資料的 IEND 前插入一個 tEXt chunk（keyword / text 為 Latin-1）"""
+    body = keyword.encode('latin-1') + b'\0' + text.encode('latin-1')
+    chunk = struct.pack('>I', len(body)) + b'tEXt' + body + struct.pack('>I', zlib.crc32(b'tEXt' + body))
+    iend = len(data) - 12  # IEND is always the last chunk: length, type, CRC
+    return data[:iend] + chunk + data[iend:]
+
+def read_png_text(path, keyword):
+    """讀取 PNG 檔中 keyword 的 tEXt 內容；沒有（或不是 PNG）時回傳 None"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(8) != PNG_SIGNATURE:
+                return None
+            prefix = keyword.encode('latin-1') + b'\0'
+            while True:
+                head = f.read(8)
+                if len(head) < 8:
+                    return None
+                length, kind = struct.unpack('>I4s', head)
+                if kind == b'IEND':
+                    return None
+                if kind == b'tEXt':
+                    body = f.read(length)
+                    if body.startswith(prefix):
+                        return body[len(prefix):].decode('latin-1')
+                    f.seek(4, os.SEEK_CUR)
+                else:
+                    f.seek(length + 4, os.SEEK_CUR)  # pixel data and CRC are skipped, not read
+    except OSError:
+        return None
+
+def write_image(img, path, fmt='png', png_level=DEFAULT_PNG_LEVEL, text=None):
+    """
+    寫出一張影像，回傳 job 報告
+    The report holds the path, format, encode time (ms) and output size
+    (bytes); `error` is set instead of raising so worker threads never
+    lose a failure. `text` is an optional (keyword, text) pair stored as
+    a PNG tEXt chunk (PNG only).
+    """
+    report = {'path': path, 'format': fmt, 'encode_ms': None, 'bytes': None, 'error': None}
+    start = time.perf_counter()
+    try:
+        if fmt == 'npy':
+            np.save(path, img)
+        elif fmt == 'png' and text:
+            ok, buf = cv2.imencode('.png', img, encode_params(fmt, png_level))
+            if not ok:
+                report['error'] = f"cv2.imencode failed for {path}"
+                return report
+            with open(path, 'wb') as f:
+                f.write(add_png_text(buf.tobytes(), *text))
+        elif not cv2.imwrite(path, img, encode_params(fmt, png_level)):
+            report['error'] = f"cv2.imwrite failed for {path}"
+            return report
+    except (OSError, ValueError, cv2.error) as e:
+        report['error'] = str(e)
+        return report
+    report['encode_ms'] = (time.perf_counter() - start) * 1000
+    report['bytes'] = os.path.getsize(path)
+    return report
+
+def load_image(path):
+    """讀回影像（NPY 或 cv2 支援的格式）；失敗時回傳 None"""
+    if path.lower().endswith('.npy'):
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+    return cv2.imread(path)
+
+class OutputWriter:
+    """
+    Background writer: submit() returns the job's path at once and the
+    file is encoded on a worker thread. The caller must not modify the
+    submitted array until the job's future is done.
+    """
+
+    def __init__(self, out_dir, fmt='png', png_level=DEFAULT_PNG_LEVEL, workers=2):
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {fmt}")
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.png_level = png_level
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="output-writer")
+        os.makedirs(out_dir, exist_ok=True)
+
+    def submit(self, img, prefix, text=None):
+        """排入寫檔 job，回傳 (path, future)；future 的結果是 write_image 的報告"""
+        path = job_path(self.out_dir, prefix, self.fmt)
+        return path, self.pool.submit(write_image, img, path, self.fmt, self.png_level, text)
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
@@ -0,0 +1,190 @@
+# profiling.py
+# Opt-in per-stage profiling for one encode / decode run: wall time
+# (perf_counter_ns), allocations (tracemalloc snapshots) and bytes copied,
+# optionally under cProfile.
+#
+#   python profiling.py big.png --message "hello" --cprofile tempFile/run.prof --json tempFile/run.json
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+class StageProfiler:
+    """
+    Collects one record per stage. Stages may nest; each record keeps its
+    depth so the table reads like a call tree, and a parent's numbers
+    include its children. Time spent taking tracemalloc snapshots is
+    subtracted from every enclosing stage, but tracing still slows down
+    allocation-heavy code; use trace_memory=False for timing only.
+    A disabled profiler still accepts stage() calls and records nothing,
+    so callers never branch.
+    """
+
+    def __init__(self, enabled=True, use_cprofile=False, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.records = []
+        self._depth = 0
+        self._overhead_ns = 0  # time spent in the profiler itself
+        self._started_tracemalloc = False
+        self._cprofile = cProfile.Profile() if enabled and use_cprofile else None
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self._cprofile:
+            self._cprofile.enable()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        量測一個階段；yield 的 record 可由呼叫端補上 bytes_copied
+        (e.g. the size of the array the stage produced).
+        """
+        record = {'stage': name, 'depth': self._depth, 'wall_ms': 0.0,
+                  'allocations': 0, 'allocated_bytes': 0, 'peak_bytes': 0, 'bytes_copied': 0}
+        if not self.enabled:
+            yield record
+            return
+
+        self.records.append(record)
+        self._depth += 1
+        if self.trace_memory:
+            mark = time.perf_counter_ns()
+            before = tracemalloc.take_snapshot()
+            base, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self._overhead_ns += time.perf_counter_ns() - mark
+        overhead = self._overhead_ns
+        start = time.perf_counter_ns()
+        try:
+            yield record
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            record['wall_ms'] = (elapsed - (self._overhead_ns - overhead)) / 1e6
+            if self.trace_memory:
+                mark = time.perf_counter_ns()
+                _, peak = tracemalloc.get_traced_memory()
+                after = tracemalloc.take_snapshot()
+                # Blocks allocated by tracemalloc.py itself (snapshots, statistics) are not the stage's
+                grown = [s for s in after.compare_to(before, 'lineno')
+                         if s.size_diff > 0 and s.traceback[0].filename != tracemalloc.__file__]
+                record['allocations'] = sum(max(s.count_diff, 0) for s in grown)
+                record['allocated_bytes'] = sum(s.size_diff for s in grown)
+                record['peak_bytes'] = max(peak - base, 0)
+                # Freeing the snapshots is profiler time too; left to the
+                # generator's exit it would land in the parent stage
+                del before, after, grown
+                self._overhead_ns += time.perf_counter_ns() - mark
+            self._depth -= 1
+
+    def close(self):
+        """停止 cProfile / tracemalloc（只停止自己啟動的）"""
+        if self._cprofile:
+            self._cprofile.disable()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def table(self):
+        """每個階段一行的文字表格"""
+        lines = [f"{'stage':32} {'wall ms':>10} {'allocs':>8} {'alloc KB':>10} {'peak KB':>10} {'copied KB':>10}"]
+        for r in self.records:
+            lines.append(
+                f"{('  ' * r['depth'] + r['stage'])[:32]:32} {r['wall_ms']:10.2f} {r['allocations']:8d} "
+                f"{r['allocated_bytes'] / 1024:10.1f} {r['peak_bytes'] / 1024:10.1f} {r['bytes_copied'] / 1024:10.1f}")
+        return lines
+
+    def cprofile_top(self, limit=15):
+        """cProfile 依累計時間排序的前幾個函式（沒有啟用時為空字串）"""
+        if not self._cprofile:
+            return ""
+        out = io.StringIO()
+        pstats.Stats(self._cprofile, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def dump_cprofile(self, path):
+        """寫出 .prof 檔（可用 snakeviz / flameprof 畫成 flame graph）"""
+        if self._cprofile:
+            self._cprofile.dump_stats(path)
+
+    def to_dict(self):
+        return {'stages': self.records, 'total_ms': sum(r['wall_ms'] for r in self.records if r['depth'] == 0)}
+
+    def export_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+def profile_round_trip(path, message, key=None, max_layers=1, use_cprofile=False, out_dir=None, trace_memory=True):
+    """imread -> embed -> imwrite -> imread -> decode，回傳 (profiler, error)"""
+    import cv2
+    import rdh
+    import crdh
+    import output_writer
+
+    profiler = StageProfiler(use_cprofile=use_cprofile, trace_memory=trace_memory)
+    try:
+        with profiler.stage("imread") as s:
+            img = cv2.imread(path)
+            if img is None:
+                return profiler, f"Failed to load image: {path}"
+            s['bytes_copied'] = img.nbytes
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            with profiler.stage("embed"):
+                result, error = rdh.embed_message_color(img, rdh.text_to_bits(message), key=key,
+                                                        max_layers=max_layers, profiler=profiler)
+        if error:
+            return profiler, error
+
+        out_path = output_writer.job_path(out_dir or os.path.dirname(os.path.abspath(path)), "profile_embedded", 'png')
+        with profiler.stage("imwrite") as s:
+            report = output_writer.write_image(result['embedded_img'], out_path)
+            s['bytes_copied'] = report['bytes'] or 0
+        with profiler.stage("imread embedded") as s:
+            embedded = cv2.imread(out_path)
+            s['bytes_copied'] = embedded.nbytes
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            with profiler.stage("decode"):
+                _, error = crdh.decode_image(embedded, key=key, profiler=profiler)
+        return profiler, error
+    finally:
+        profiler.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage profile of one RDH encode / decode round trip")
+    parser.add_argument('image')
+    parser.add_argument('--message', default="RDH profile")
+    parser.add_argument('--key', default=None)
+    parser.add_argument('--max-layers', type=int, default=1)
+    parser.add_argument('--cprofile', default=None, help="also run under cProfile and write the .prof file here")
+    parser.add_argument('--json', default=None, help="export the stage table as JSON")
+    parser.add_argument('--no-memory', action='store_true', help="skip tracemalloc (timing only, no tracing slowdown)")
+    args = parser.parse_args(argv)
+
+    out_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tempFile", "jobs")
+    os.makedirs(out_dir, exist_ok=True)
+    profiler, error = profile_round_trip(args.image, args.message, args.key, args.max_layers,
+                                         use_cprofile=bool(args.cprofile), out_dir=out_dir,
+                                         trace_memory=not args.no_memory)
+    print('\n'.join(profiler.table()))
+    if error:
+        print(f"error: {error}")
+    if args.cprofile:
+        profiler.dump_cprofile(args.cprofile)
+        print(profiler.cprofile_top())
+        print(f"cProfile stats written to {args.cprofile}")
+    if args.json:
+        profiler.export_json(args.json)
+        print(f"Stage table written to {args.json}")
+    return 1 if error else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
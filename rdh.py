@@ -1,96 +1,897 @@
 # rdh.py - Improved Version
+import functools
+import hashlib
+import struct
+import zlib
 import cv2
 import numpy as np
+import kernels
+import profiling
 
-def embed_data(grayscaleImg, data_bits, peak):
+# Header layout (bits), one header per layer:
+# peak | message length | zero bin | location map size (bytes) | layer index | peak of the layer below
+# | mask descriptor size (bytes) | CRC32 of everything after the header | header checksum
+# followed by the location map, the mask descriptor and the payload bits.
+HEADER_PEAK_BITS = 8
+HEADER_LENGTH_BITS = 32
+HEADER_ZERO_BITS = 8
+HEADER_MAP_BITS = 16
+HEADER_LAYER_BITS = 8
+HEADER_NEXT_PEAK_BITS = 8
+HEADER_MASK_BITS = 16
+HEADER_PAYLOAD_CRC_BITS = 32
+HEADER_CRC_BITS = 16
+HEADER_BITS = (HEADER_PEAK_BITS + HEADER_LENGTH_BITS + HEADER_ZERO_BITS + HEADER_MAP_BITS
+               + HEADER_LAYER_BITS + HEADER_NEXT_PEAK_BITS + HEADER_MASK_BITS
+               + HEADER_PAYLOAD_CRC_BITS + HEADER_CRC_BITS)
+# (field, bits) in header order; stored in sidecars so a layout change is detected
+HEADER_LAYOUT = (('peak', HEADER_PEAK_BITS), ('length', HEADER_LENGTH_BITS), ('zero', HEADER_ZERO_BITS),
+                 ('map_size', HEADER_MAP_BITS), ('layer', HEADER_LAYER_BITS), ('next_peak', HEADER_NEXT_PEAK_BITS),
+                 ('mask_size', HEADER_MASK_BITS), ('payload_crc', HEADER_PAYLOAD_CRC_BITS), ('header_crc', HEADER_CRC_BITS))
+
+# Mask descriptor types
+MASK_RECTS = b'R'        # count (uint16) + (x, y, w, h) uint16 per rectangle
+MASK_TRANSITIONS = b'T'  # zlib(per-row transition counts + column deltas against the row above)
+MASK_BITMAP = b'M'       # zlib(packbits of the binary mask), for masks too ragged for 'T'
+
+MAX_LAYERS = 8
+
+# Difference expansion (embed_message_de) reuses the header with peak = DE_PEAK
+# (histogram shifting always has peak >= 1) and zero = the difference threshold
+DE_PEAK = 0
+DE_PROBE_PIXELS = 1 << 14  # without a key the header is looked for in this many pixels first
+
+def bits_to_array(data_bits):
+    """'0'/'1' 位元字串 -> uint8 陣列"""
+    return np.frombuffer(data_bits.encode('ascii'), dtype=np.uint8) - ord('0')
+
+def bytes_to_bits(data):
+    """bytes -> '0'/'1' 位元字串"""
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+    return (bits + ord('0')).tobytes().decode('ascii')
+
+def text_to_bits(text):
+    """文字 -> UTF-8 位元字串"""
+    return bytes_to_bits(text.encode('utf-8'))
+
+def bits_crc32(data_bits):
+    """位元字串的 CRC32（先打包成 bytes）"""
+    return zlib.crc32(np.packbits(bits_to_array(data_bits)).tobytes())
+
+def header_checksum(header_bits):
+    """header 欄位的 16-bit 檢查碼"""
+    return bits_crc32(header_bits) & (2 ** HEADER_CRC_BITS - 1)
+
+def key_to_seed(key):
+    """把祕密金鑰字串轉成固定的亂數種子"""
+    return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest(), 'big')
+
+@functools.lru_cache(maxsize=2)
+def keyed_positions(size, key):
+    """
+    金鑰決定的掃描順序：range(size) 的一個排列
+    One permutation covers the whole plane, whatever the peak, so the
+    decoder permutes the plane once and then probes every candidate peak
+    on a short prefix, as it does without a key. Read-only and cached for
+    the last (size, key) pairs; int32 halves the memory of a large plane.
+    """
+    positions = np.random.default_rng(key_to_seed(key)).permutation(np.arange(size, dtype=np.int32))
+    positions.flags.writeable = False
+    return positions
+
+def carrier_order(carriers, size, key=None):
+    """
+    依金鑰打亂載體像素的順序
+    Without a key the carriers stay in raster order. With a key they are
+    the carriers among keyed_positions(size, key), taken in that order;
+    `size` is the length of the plane the carrier indices point into.
+    """
+    if not key:
+        return carriers
+    positions = keyed_positions(size, key)
+    is_carrier = np.zeros(size, dtype=bool)
+    is_carrier[carriers] = True
+    return positions[is_carrier[positions]]
+
+def load_mask(path):
+    """讀取二值遮罩影像（非 0 的像素可以嵌入）"""
+    mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        raise ValueError(f"無法讀取遮罩影像: {path}")
+    return mask > 0
+
+def mask_region(mask, shape):
+    """
+    允許嵌入的像素：raster order 的一維索引
+    `mask` is None (whole frame), a list of (x, y, w, h) rectangles or a
+    binary mask array of the image size. Rectangles are expanded directly,
+    so the cost scales with the ROI area rather than the frame.
+    """
+    if mask is None:
+        return None
+    h, w = shape[:2]
+    if isinstance(mask, np.ndarray):
+        if mask.shape[:2] != (h, w):
+            raise ValueError(f"遮罩大小 {mask.shape[:2]} 與影像大小 {(h, w)} 不符")
+        return np.flatnonzero(mask.reshape(h, w, -1)[:, :, 0])
+
+    pieces = []
+    for x, y, rw, rh in mask:
+        x0, y0, x1, y1 = max(0, x), max(0, y), min(w, x + rw), min(h, y + rh)
+        if x1 > x0 and y1 > y0:
+            pieces.append((np.arange(y0, y1)[:, None] * w + np.arange(x0, x1)).ravel())
+    if not pieces:
+        return np.zeros(0, dtype=np.intp)
+    if len(pieces) == 1:
+        return pieces[0]
+    # Overlapping rectangles: keep each pixel once, in raster order
+    return np.unique(np.concatenate(pieces))
+
+def encode_mask(mask, shape):
+    """把遮罩編成精簡的 descriptor（放在 header 後面）"""
+    if mask is None:
+        return b''
+    h, w = shape[:2]
+    if isinstance(mask, np.ndarray):
+        bitmap = mask.reshape(h, w, -1)[:, :, 0] != 0
+
+        # Columns where each row switches between outside and inside the mask
+        padded = np.zeros((h, w + 2), dtype=np.int8)
+        padded[:, 1:-1] = bitmap
+        rows, cols = np.nonzero(np.diff(padded, axis=1))
+        counts = np.bincount(rows, minlength=h)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        # Smooth outlines: store each column relative to the same transition one row up
+        same = (rows > 0) & (counts[rows] == counts[rows - 1])
+        above = starts[rows - 1] + np.arange(len(rows)) - starts[rows]
+        deltas = cols - np.where(same, cols[np.where(same, above, 0)], 0)
+        transitions = zlib.compress(counts.astype('>u2').tobytes() + deltas.astype('>i2').tobytes(), 9)
+
+        packed = zlib.compress(np.packbits(bitmap).tobytes(), 9)
+        return MASK_TRANSITIONS + transitions if len(transitions) <= len(packed) else MASK_BITMAP + packed
+    rects = [(max(0, x), max(0, y), min(w, x + rw) - max(0, x), min(h, y + rh) - max(0, y)) for x, y, rw, rh in mask]
+    rects = [r for r in rects if r[2] > 0 and r[3] > 0]
+    return MASK_RECTS + struct.pack('>H', len(rects)) + b''.join(struct.pack('>4H', *r) for r in rects)
+
+def region_plane(Y, region):
+    """取出允許區域的像素（一維）；沒有遮罩時回傳整張 Y"""
+    if region is None:
+        return Y
+    return np.ascontiguousarray(Y).ravel()[region]
+
+def find_zero_bin(hist, peak):
+    """
+    選擇 peak 左側的 zero（或最小）bin
+    Pixels in (zero, peak) are shifted down by one; pixels already at zero
+    stay put and are recorded in the location map. Returns None when no
+    bin below the peak can take the shift.
+    """
+    hist = np.asarray(hist).ravel()
+    if peak < 1:
+        return None
+    if hist[peak - 1] == 0:
+        # Empty neighbour: nothing needs to move at all
+        return peak - 1
+    if peak < 2:
+        return None
+    # Smallest bin below peak-1; among ties the one closest to the peak shifts fewest pixels
+    candidates = hist[:peak - 1]
+    return int(peak - 2 - np.argmin(candidates[::-1]))
+
+def find_peak(hist):
+    """選擇可用的 peak：次數最多、且左側有可用 zero bin 的值"""
+    hist = np.asarray(hist).ravel()
+    for peak in np.argsort(-hist, kind='stable'):
+        peak = int(peak)
+        if find_zero_bin(hist, peak) is not None:
+            return peak
+    return None
+
+def build_location_map(grayscaleImg, peak, zero):
+    """
+    建立壓縮後的 location map
+    After shifting, bin `zero` holds both the pixels originally at zero and
+    the ones shifted down from zero+1. One bit per such pixel (raster order)
+    marks the original ones; the bitmap is packed and zlib-compressed.
+    Returns b'' when the zero bin is empty (no overflow).
+    """
+    flat = grayscaleImg.ravel()
+    if zero >= peak - 1:
+        return b''
+    # zero <= v <= zero + 1  <=>  (v - zero) mod 256 < 2, with one scratch plane
+    scratch = np.subtract(flat, np.uint8(zero))
+    in_overlap = np.less(scratch, 2, out=scratch.view(np.bool_))
+    overlap = flat[in_overlap]
+    is_original = overlap == zero
+    if not is_original.any():
+        return b''
+    return zlib.compress(np.packbits(is_original).tobytes(), 9)
+
+def build_header(peak, zero, message_length, location_map=b'', layer=0, next_peak=0, mask_descriptor=b'', payload_crc=0):
+    """
+    組合 header 位元字串（不含 location map 與遮罩 descriptor 本身）
+    `payload_crc` is the CRC32 of the bits that follow the header; the
+    header checksum over all fields is appended last.
+    """
+    fields = (
+        format(peak, f'0{HEADER_PEAK_BITS}b')
+        + format(message_length, f'0{HEADER_LENGTH_BITS}b')
+        + format(zero, f'0{HEADER_ZERO_BITS}b')
+        + format(len(location_map), f'0{HEADER_MAP_BITS}b')
+        + format(layer, f'0{HEADER_LAYER_BITS}b')
+        + format(next_peak, f'0{HEADER_NEXT_PEAK_BITS}b')
+        + format(len(mask_descriptor), f'0{HEADER_MASK_BITS}b')
+        + format(payload_crc, f'0{HEADER_PAYLOAD_CRC_BITS}b')
+    )
+    return fields + format(header_checksum(fields), f'0{HEADER_CRC_BITS}b')
+
+def shift_histogram(hist, peak, zero, ones):
+    """
+    嵌入後的直方圖（只用直方圖計算）
+    Bins (zero, peak) move down by one and merge into bin zero, and `ones`
+    pixels leave the peak for peak-1.
+    """
+    hist = np.asarray(hist, dtype=np.float64).ravel()
+    shifted = hist.copy()
+    if zero < peak - 1:
+        shifted[zero] = hist[zero] + hist[zero + 1]
+        shifted[zero + 1:peak - 1] = hist[zero + 2:peak]
+        shifted[peak - 1] = 0
+    shifted[peak - 1] += ones
+    shifted[peak] -= ones
+    return shifted
+
+def as_calc_hist(counts):
+    """256 個計數 -> 與 cv2.calcHist 相同的 (256, 1) float32 陣列"""
+    return np.asarray(counts, dtype=np.float32).reshape(256, 1)
+
+def estimate_layers(hist, payload_bits, max_layers=MAX_LAYERS):
+    """
+    預估多層嵌入的容量與失真（不需要讀取影像）
+    Simulates the layers on the histogram alone: each layer picks its own
+    peak / zero bin, the location map is counted at its uncompressed size
+    and half of the embedded bits are assumed to be ones. Pixels are
+    tracked per (value, times moved down) so that repeated shifts of the
+    same pixels are charged their squared displacement. Returns one dict
+    per layer with the bits it carries, the pixels it shifts and the
+    predicted PSNR of the image after that layer.
+    """
+    hist = np.asarray(hist, dtype=np.float64).ravel()
+    total_pixels = hist.sum()
+    # moved[v, k]: pixels currently at value v that have been moved down k times
+    moved = np.zeros((256, max_layers + 1))
+    moved[:, 0] = hist
+    displacement_sq = np.arange(max_layers + 1) ** 2
+    remaining = payload_bits
+    plan = []
+
+    for layer in range(max_layers):
+        if remaining <= 0:
+            break
+        hist = moved.sum(axis=1)
+        peak = find_peak(hist)
+        if peak is None:
+            break
+        zero = find_zero_bin(hist, peak)
+        overlap = hist[zero] + hist[zero + 1] if zero < peak - 1 and hist[zero] > 0 else 0
+        overhead = HEADER_BITS + 8 * int(np.ceil(overlap / 8))
+        capacity = int(hist[peak]) - overhead
+        if capacity <= 0:
+            break
+
+        bits = min(capacity, remaining)
+        shifted = int(hist[zero + 1:peak].sum()) if zero < peak - 1 else 0
+        ones_fraction = (bits + overhead) / 2 / hist[peak]
+
+        # Same moves as shift_histogram, one column further down the displacement axis
+        updated = moved.copy()
+        if zero < peak - 1:
+            updated[zero + 1:peak] = 0
+            updated[zero:peak - 1, 1:] += moved[zero + 1:peak, :-1]
+        updated[peak - 1, 1:] += moved[peak, :-1] * ones_fraction
+        updated[peak] = moved[peak] * (1 - ones_fraction)
+        moved = updated
+
+        mse = (moved @ displacement_sq).sum() / total_pixels
+        plan.append({
+            'layer': layer,
+            'peak': peak,
+            'zero': zero,
+            'capacity': capacity,
+            'bits': bits,
+            'shifted': shifted,
+            'psnr': float('inf') if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+        })
+
+        remaining -= bits
+
+    return plan
+
+def location_map_bound_bits(overlap):
+    """location map 的位元數上限：未壓縮大小加上 zlib 的最大額外開銷"""
+    n = np.ceil(np.asarray(overlap, dtype=np.float64) / 8)
+    return 8 * (n + 11 + 5 * (n // 16384)) * (n > 0)
+
+def predicted_psnr(shifted, embedded_bits, total_pixels):
+    """預估 PSNR：每個位移像素與一半的嵌入位元各差 1"""
+    mse = (np.asarray(shifted, dtype=np.float64) + embedded_bits / 2) / total_pixels
+    with np.errstate(divide='ignore'):
+        return np.where(mse > 0, 10 * np.log10(255.0 ** 2 / np.maximum(mse, 1e-300)), np.inf)
+
+def pair_table(hist, side_bits=0):
+    """
+    所有 (peak, zero) 組合的容量與位移像素數（只用直方圖，O(256²)）
+    Returns (capacity, shifted), 256x256 arrays indexed [peak, zero].
+    capacity is the payload room left after the header, the location map
+    bound and `side_bits` (e.g. a mask descriptor), and -1 for unusable pairs.
+    """
+    hist = np.asarray(hist, dtype=np.float64).ravel()
+    cum = np.concatenate(([0.0], np.cumsum(hist)))  # cum[k] = pixels below value k
+    peak = np.arange(256)[:, None]
+    zero = np.arange(256)[None, :]
+    # zero = peak-1 only works when that bin is empty: it receives the '1' bits
+    valid = (zero < peak - 1) | ((zero == peak - 1) & (hist[np.maximum(peak - 1, 0)] == 0))
+
+    # Pixels in (zero, peak) move down by one
+    shifted = np.where(valid, cum[peak] - cum[np.minimum(zero + 1, 256)], 0)
+    # Pixels already at zero need a location map over bins zero and zero+1
+    overlap = hist[zero] + hist[np.minimum(zero + 1, 255)]
+    needs_map = valid & (zero < peak - 1) & (hist[zero] > 0)
+    map_bits = np.where(needs_map, location_map_bound_bits(overlap), 0)
+    capacity = np.where(valid, hist[peak] - HEADER_BITS - side_bits - map_bits, -1)
+    return capacity, shifted
+
+def rank_pairs(hist, payload_bits=0, side_bits=0, limit=10, by='psnr'):
+    """
+    列出最好的單層 (peak, zero) 選項
+    Pairs that fit `payload_bits` are ranked by predicted PSNR (fewest
+    shifted pixels first); each option reports capacity, shifted pixels
+    and predicted PSNR. With by='capacity' the most room comes first
+    (fewest shifted pixels among equals) and the PSNR is predicted for a
+    pair filled to capacity.
+    """
+    capacity, shifted = pair_table(hist, side_bits)
+    total_pixels = np.asarray(hist).sum()
+    peaks, zeros = np.nonzero((capacity >= max(payload_bits, 1)))
+    room, moved = capacity[peaks, zeros], shifted[peaks, zeros]
+    order = np.lexsort((moved, -room) if by == 'capacity' else (-room, moved))[:limit]
+    return [{
+        'peak': int(peaks[i]),
+        'zero': int(zeros[i]),
+        'capacity': int(room[i]),
+        'shifted': int(moved[i]),
+        'psnr': float(predicted_psnr(moved[i], (room[i] if by == 'capacity' else payload_bits) + HEADER_BITS, total_pixels))
+    } for i in order]
+
+def plan_embedding(hist, payload_bits, side_bits=0):
+    """
+    找出嵌入 payload_bits 失真最小的方案（單一或兩組不重疊的 peak/zero）
+    Two pairs whose [zero, peak] ranges do not overlap never touch each
+    other's bins, so they are embedded as two layers and their capacities
+    and shifted pixels simply add up. Only pairs on each peak's
+    capacity / shift frontier (a closer zero with at least the same
+    capacity always wins) are combined, which keeps the search small.
+    Returns {'pairs', 'capacity', 'shifted', 'psnr'} with the pairs in
+    layer order, or None when nothing fits.
+    """
+    capacity, shifted = pair_table(hist, side_bits)
+    total_pixels = np.asarray(hist).sum()
+    plans = []
+
+    # Best single pair: fewest shifted pixels, then most room
+    peaks, zeros = np.nonzero(capacity >= payload_bits)
+    if len(peaks):
+        best = np.lexsort((-capacity[peaks, zeros], shifted[peaks, zeros]))[0]
+        p, z = int(peaks[best]), int(zeros[best])
+        plans.append(([(p, z)], capacity[p, z], shifted[p, z], payload_bits + HEADER_BITS))
+
+    # Frontier: more capacity than every zero closer to the same peak
+    closer_max = np.maximum.accumulate(capacity[:, ::-1], axis=1)[:, ::-1]
+    closer_max = np.concatenate((closer_max[:, 1:], np.full((256, 1), -1.0)), axis=1)
+    frontier = (capacity > 0) & (capacity > closer_max)
+    # A pair that fits alone, or costs as much as the best single pair, cannot be part of a better combination
+    frontier &= capacity < payload_bits
+    if plans:
+        frontier &= shifted < plans[0][2]
+    # ...nor can one too small to reach the payload even with the largest partner
+    frontier &= capacity >= payload_bits - side_bits - capacity[frontier].max(initial=0)
+    P, Z = np.nonzero(frontier)
+    C, S = capacity[P, Z], shifted[P, Z]
+
+    # Pair b (layer 0, carries the side bits) above pair a (layer 1)
+    disjoint = P[:, None] < Z[None, :]
+    total = C[:, None] + C[None, :] + side_bits
+    feasible = disjoint & (total >= payload_bits)
+    if feasible.any():
+        cost = np.where(feasible, S[:, None] + S[None, :], np.inf)
+        a, b = np.unravel_index(np.argmin(cost), cost.shape)
+        plans.append(([(int(P[b]), int(Z[b])), (int(P[a]), int(Z[a]))], total[a, b], cost[a, b],
+                      payload_bits + 2 * HEADER_BITS))
+
+    if not plans:
+        return None
+    pairs, room, moved, bits = min(plans, key=lambda plan: (plan[2] + plan[3] / 2, len(plan[0])))
+    return {
+        'pairs': pairs,
+        'capacity': int(room),
+        'shifted': int(moved),
+        'psnr': float(predicted_psnr(moved, bits, total_pixels))
+    }
+
+def embed_data(grayscaleImg, data_bits, peak, zero=0, key=None, out=None):
     """
     將資料位元嵌入灰階影像（改進版）
+    Pixels in (zero, peak) are shifted down by one, then the first
+    len(data_bits) peak pixels in scan order carry the bits
+    ('0' -> peak, '1' -> peak-1). The scan order is raster order, or the
+    keyed pixel order (see carrier_order) when `key` is given.
+
+    Buffers: `grayscaleImg` is only read, unless it is also `out`. The
+    result is written to `out` (a C-contiguous uint8 array of the same
+    shape; pass grayscaleImg itself to embed in place) or, when out is
+    None, to a new array. Besides the carrier indices, the only temporary
+    is one uint8 scratch plane, or none with Numba (see kernels.py).
+    Returns (embedded_img, embedded_bits); embedded_img is `out` when given.
     """
-    print(f"[DEBUG] Embedding {len(data_bits)} bits using peak {peak}")
-    
-    # Flatten and copy
-    img_flat = grayscaleImg.flatten()
-    embedded_img = img_flat.copy()
-    
-    # Count available pixels at peak for capacity check
-    peak_pixels = np.sum(img_flat == peak)
+    print(f"[DEBUG] Embedding {len(data_bits)} bits using peak {peak}, zero {zero}")
+
+    if out is None:
+        out = grayscaleImg.copy()
+    else:
+        if out.shape != grayscaleImg.shape or out.dtype != np.uint8 or not out.flags.c_contiguous:
+            raise ValueError("out must be a C-contiguous uint8 array shaped like the image")
+        if out is not grayscaleImg:
+            np.copyto(out, grayscaleImg)
+    img_flat = out.ravel()  # a view, so every write below lands in out
+
+    # Step 1: find the peak pixels and shift pixels in (zero, peak) down by 1
+    # to empty the peak-1 bin (left undone when the peak is too small)
+    carriers, shifted = kernels.collect_and_shift(img_flat, peak, zero, len(data_bits))
+    peak_pixels = len(carriers)
     print(f"[DEBUG] Available peak pixels: {peak_pixels}")
-    
+
     if peak_pixels < len(data_bits):
         print(f"警告：Peak 像素數 ({peak_pixels}) 少於要嵌入的位元數 ({len(data_bits)})")
-        return embedded_img.reshape(grayscaleImg.shape), 0
-    
-    # Step 1: Shift pixels < peak down by 1 to make room
-    shift_count = 0
-    for i in range(len(embedded_img)):
-        if embedded_img[i] < peak and embedded_img[i] > 0:  # Avoid going below 0
-            embedded_img[i] -= 1
-            shift_count += 1
-    
-    print(f"[DEBUG] Shifted {shift_count} pixels down")
-    
-    # Step 2: Embed data bits into peak pixels
-    embedding_bit = 0
-    embedded_count = 0
-    
-    for i in range(len(embedded_img)):
-        if embedding_bit >= len(data_bits):
-            break
-            
-        # Only embed in pixels that are still at peak value after shifting
-        if img_flat[i] == peak:  # Use original image to identify peak pixels
-            if data_bits[embedding_bit] == '1':
-                embedded_img[i] = peak - 1  # Represent '1' as peak-1
-            else:
-                embedded_img[i] = peak      # Represent '0' as peak
-            
-            embedding_bit += 1
-            embedded_count += 1
-    
-    print(f"[DEBUG] Successfully embedded {embedded_count} bits")
-    
-    # Ensure valid pixel values and reshape
-    embedded_img = np.clip(embedded_img, 0, 255).reshape(grayscaleImg.shape)
-    
-    return embedded_img, embedding_bit
+        return out, 0
+    print(f"[DEBUG] Shifted {shifted} pixels down")
+
+    # Step 2: Embed data bits into peak pixels ('1' -> peak-1, '0' stays at peak)
+    bits = bits_to_array(data_bits)
+    carriers = carrier_order(carriers, img_flat.size, key)[:len(bits)]
+    img_flat[carriers[bits == 1]] = peak - 1
+    embedding_bit = len(bits)
+
+    print(f"[DEBUG] Successfully embedded {embedding_bit} bits")
 
-def embed_data_color(img_color, data_bits, peak):
+    return out, embedding_bit
+
+def embed_data_color(img_color, data_bits, peak, zero=0, key=None):
     """
     將資料嵌入彩色影像（改進版）
+    The Y plane is embedded in place on its own contiguous copy and the
+    YCrCb image is converted back to BGR in its own buffer, so the only
+    allocations are that buffer (the result) and one plane.
     """
     print(f"[DEBUG] Color embedding: {len(data_bits)} bits, peak = {peak}")
-    
+
     # Convert to YCrCb
     img_ycrcb = cv2.cvtColor(img_color, cv2.COLOR_BGR2YCrCb)
-    Y, Cr, Cb = cv2.split(img_ycrcb)
-    
-    # Ensure correct data type
-    if Y.dtype != np.uint8:
-        Y = Y.astype(np.uint8)
-    
+    Y = np.ascontiguousarray(img_ycrcb[:, :, 0])
+
     # Check histogram and capacity
     hist = cv2.calcHist([Y], [0], None, [256], [0, 256])
     capacity = int(hist[peak][0])
     print(f"[DEBUG] Peak {peak} has {capacity} pixels available")
-    
+
     if len(data_bits) > capacity:
         print(f"錯誤：資料太大無法嵌入。需要 {len(data_bits)} bits，可用 {capacity} bits")
         return img_color, 0
-    
-    # Embed data
-    embedded_Y, used_bits = embed_data(Y, data_bits, peak)
-    embedded_Y = np.clip(embedded_Y, 0, 255).astype(np.uint8)
-    
-    # Merge channels and convert back
-    embedded_ycrcb = cv2.merge([embedded_Y, Cr, Cb])
-    embedded_color = cv2.cvtColor(embedded_ycrcb, cv2.COLOR_YCrCb2BGR)
-    
+
+    # Embed data (values stay in 0..255: only pixels above zero move down)
+    _, used_bits = embed_data(Y, data_bits, peak, zero, key, out=Y)
+
+    # Put Y back and convert in place
+    img_ycrcb[:, :, 0] = Y
+    embedded_color = cv2.cvtColor(img_ycrcb, cv2.COLOR_YCrCb2BGR, dst=img_ycrcb)
+
     print(f"[DEBUG] Embedding completed: {used_bits} bits used")
     return embedded_color, used_bits
 
-def analyze_image_for_embedding(img_path):
+def embed_layer(Y, payload_bits, layer=0, next_peak=0, key=None, mask_descriptor=b'', hist=None, profiler=None, pair=None, out=None):
+    """
+    嵌入一層：選擇 peak / zero bin、建立 header 與 location map
+    `Y` is the whole plane or the 1-D ROI plane from region_plane.
+    `payload_bits` may be longer than this layer can carry; the layer takes
+    as many bits as fit. `hist` is Y's histogram if already known (e.g.
+    the previous layer's 'hist_embedded'). `pair` forces a (peak, zero)
+    choice, e.g. from plan_embedding. `out` is passed to embed_data (use
+    out=Y to embed in place); Y is left untouched when an error is
+    returned. Returns (embedded_Y, info, error).
+    """
+    profiler = profiler or profiling.StageProfiler(enabled=False)
+    if hist is None:
+        with profiler.stage("calcHist"):
+            hist = cv2.calcHist([Y], [0], None, [256], [0, 256])
+
+    if pair is not None:
+        peak, zero = pair
+        if not 0 <= zero < peak <= 255:
+            return None, None, f"錯誤：無效的 peak / zero bin ({peak}, {zero})"
+    else:
+        peak = find_peak(hist)
+        if peak is None:
+            return None, None, "錯誤：找不到可用的 peak / zero bin"
+        zero = find_zero_bin(hist, peak)
+
+    with profiler.stage("location map"):
+        location_map = build_location_map(Y, peak, zero)
+    if len(location_map) >= 2 ** HEADER_MAP_BITS:
+        return None, None, f"錯誤：location map 太大 ({len(location_map)} bytes)"
+
+    side_bits = bytes_to_bits(location_map) + bytes_to_bits(mask_descriptor)
+    capacity = int(hist[peak][0])
+    room = min(capacity - HEADER_BITS - len(side_bits), 2 ** HEADER_LENGTH_BITS - 1)
+    if room <= 0:
+        return None, None, f"Data too large to embed. Required: {HEADER_BITS + len(side_bits) + len(payload_bits)} bits, Available: {capacity} bits"
+
+    with profiler.stage("header + CRC"):
+        layer_bits = payload_bits[:room]
+        payload_crc = bits_crc32(side_bits + layer_bits)
+        header_bits = build_header(peak, zero, len(layer_bits), location_map, layer, next_peak, mask_descriptor, payload_crc)
+        full_data_bits = header_bits + side_bits + layer_bits
+    with profiler.stage("shift + embed") as s:
+        embedded_Y, used_bits = embed_data(Y, full_data_bits, peak, zero, key, out=out)
+        s['bytes_copied'] = 0 if embedded_Y is Y else embedded_Y.nbytes
+    # The embedded histogram follows from the shift and the number of ones
+    hist_embedded = as_calc_hist(shift_histogram(hist, peak, zero, full_data_bits.count('1')))
+
+    return embedded_Y, {
+        'layer': layer,
+        'peak': peak,
+        'zero': zero,
+        'overflow': int(hist[zero][0]) if zero < peak - 1 else 0,
+        'location_map_bytes': len(location_map),
+        'capacity': capacity,
+        'payload_bits': len(layer_bits),
+        'used_bits': used_bits,
+        'full_data_bits': len(full_data_bits),
+        'payload_crc': payload_crc,
+        'hist': hist,
+        'hist_embedded': hist_embedded
+    }, None
+
+def _prepare_embedding(img_color, mask, profiler, out=None, hist=None, round_trip=False):
+    """
+    Shared start of embed_message_color and embed_message_de: checks
+    `out`, converts to YCrCb (into `out` when given), takes the Y
+    histogram unless `hist` is given, and resolves the mask. With
+    `round_trip` the YCrCb image is first replaced by its YCrCb -> BGR ->
+    YCrCb round trip. Returns ((img_ycrcb, Y_full, hist, region,
+    mask_descriptor, Y), error); Y is the contiguous plane to embed in,
+    the ROI pixels when there is a mask.
+    """
+    with profiler.stage("cvtColor BGR->YCrCb") as s:
+        if out is not None and (out.shape != img_color.shape or out.dtype != np.uint8 or not out.flags.c_contiguous):
+            return None, "錯誤：out 必須是與影像同尺寸的 uint8 陣列"
+        img_ycrcb = cv2.cvtColor(img_color, cv2.COLOR_BGR2YCrCb, dst=out)
+        if round_trip:
+            np.copyto(img_ycrcb, cv2.cvtColor(cv2.cvtColor(img_ycrcb, cv2.COLOR_YCrCb2BGR), cv2.COLOR_BGR2YCrCb))
+        Y_full = np.ascontiguousarray(img_ycrcb[:, :, 0])
+        s['bytes_copied'] = (3 if round_trip else 1) * img_ycrcb.nbytes + Y_full.nbytes
+    if hist is None:
+        with profiler.stage("calcHist"):
+            hist = cv2.calcHist([Y_full], [0], None, [256], [0, 256])
+
+    with profiler.stage("mask / region") as s:
+        try:
+            region = mask_region(mask, Y_full.shape)
+        except ValueError as e:
+            return None, f"錯誤：{e}"
+        mask_descriptor = encode_mask(mask, Y_full.shape)
+        if len(mask_descriptor) >= 2 ** HEADER_MASK_BITS:
+            return None, f"錯誤：遮罩 descriptor 太大 ({len(mask_descriptor)} bytes)"
+        Y = region_plane(Y_full, region)
+        s['bytes_copied'] = 0 if region is None else Y.nbytes
+    return (img_ycrcb, Y_full, hist, region, mask_descriptor, Y), None
+
+def embed_message_color(img_color, message_bits, key=None, max_layers=1, mask=None, profiler=None, plan=None, out=None, hist=None):
+    """
+    選擇 peak / zero bin、建立 header 與 location map，並嵌入訊息
+    Returns (result, error) like crdh.decode_image. `key`, `max_layers`,
+    `mask` and `plan` are described in README.md (Embedding from Python);
+    `hist` is the Y histogram of img_color if already known.
+
+    Buffers: the result is written to `out` when given (a C-contiguous
+    uint8 array shaped like img_color, e.g. reused across a batch), and
+    'embedded_img' is then `out`; otherwise it is allocated. img_color is
+    only read, unless it is `out`; in that case it is overwritten even
+    when an error is returned, since BGR -> YCrCb is not invertible.
+    """
+    profiler = profiler or profiling.StageProfiler(enabled=False)
+    prepared, error = _prepare_embedding(img_color, mask, profiler, out, hist)
+    if error:
+        return None, error
+    img_ycrcb, Y_full, hist, region, mask_descriptor, Y = prepared
+    plane_hist = hist if region is None else cv2.calcHist([Y], [0], None, [256], [0, 256])
+
+    layers = []
+    remaining = message_bits
+    next_peak = 0
+    while True:
+        # The mask descriptor travels once, in layer 0
+        with profiler.stage(f"layer {len(layers)}"):
+            Y, info, error = embed_layer(Y, remaining, len(layers), next_peak, key, b'' if layers else mask_descriptor,
+                                         layers[-1]['hist_embedded'] if layers else plane_hist, profiler,
+                                         plan[len(layers)] if plan else None, out=Y)
+        if error:
+            return None, error
+        layers.append(info)
+        remaining = remaining[info['payload_bits']:]
+        next_peak = info['peak']
+        print(f"[DEBUG] Layer {info['layer']}: peak {info['peak']}, {info['payload_bits']} payload bits")
+        if not remaining:
+            break
+        if len(layers) >= (len(plan) if plan else min(max_layers, 2 ** HEADER_LAYER_BITS)):
+            required = len(message_bits) + sum(l['full_data_bits'] - l['payload_bits'] for l in layers)
+            capacity = sum(l['capacity'] for l in layers)
+            return None, f"Data too large to embed. Required: {required} bits, Available: {capacity} bits ({len(layers)} layer(s))"
+
+    with profiler.stage("merge + cvtColor YCrCb->BGR") as s:
+        if region is not None:
+            Y_full.ravel()[region] = Y
+            Y = Y_full
+        img_ycrcb[:, :, 0] = Y
+        embedded_color = cv2.cvtColor(img_ycrcb, cv2.COLOR_YCrCb2BGR, dst=img_ycrcb)
+        s['bytes_copied'] = Y.nbytes
+
+    outer = layers[-1]
+    # Pixels outside the region keep their values
+    hist_embedded = hist - plane_hist + outer['hist_embedded']
+    return {
+        'embedded_img': embedded_color,
+        'peak': outer['peak'],
+        'zero': outer['zero'],
+        'overflow': sum(l['overflow'] for l in layers),
+        'location_map_bytes': sum(l['location_map_bytes'] for l in layers),
+        'capacity': sum(l['capacity'] for l in layers),
+        'used_bits': sum(l['used_bits'] for l in layers),
+        'full_data_bits': sum(l['full_data_bits'] for l in layers),
+        'layers': layers,
+        'region_pixels': Y_full.size if region is None else len(region),
+        'mask_descriptor': mask_descriptor,
+        'hist': hist,
+        'hist_embedded': hist_embedded
+    }, None
+
+# Round-trip Y range per chroma (index Cr * 256 + Cb), filled in on first use
+_de_lo = np.full(256 * 256, 255, dtype=np.uint8)
+_de_hi = np.zeros(256 * 256, dtype=np.uint8)
+_de_known = np.zeros(256 * 256, dtype=bool)
+
+def de_bounds_table(chroma):
+    """
+    (lo, hi)：每個 chroma (Cr * 256 + Cb) 下，YCrCb -> BGR -> YCrCb 完全不變的 Y 範圍
+    A Y outside this range clips or rounds in BGR, and the decoder would
+    read another Y. The range is contiguous for every chroma, and empty
+    (lo > hi) for chroma no Y can carry exactly. Ranges come from OpenCV's
+    own conversion, computed for the chroma values not seen before and
+    kept for the process.
+    """
+    missing = np.flatnonzero((np.bincount(chroma.ravel(), minlength=256 * 256) > 0) & ~_de_known)
+    if len(missing):
+        block = np.empty((256, len(missing), 3), dtype=np.uint8)  # rows: Y, columns: chroma
+        block[:, :, 0] = np.arange(256, dtype=np.uint8)[:, None]
+        block[:, :, 1] = missing >> 8
+        block[:, :, 2] = missing & 255
+        exact = (cv2.cvtColor(cv2.cvtColor(block, cv2.COLOR_YCrCb2BGR), cv2.COLOR_BGR2YCrCb) == block).all(axis=2)
+        usable = exact.any(axis=0)
+        _de_lo[missing] = np.where(usable, exact.argmax(axis=0), 255)
+        _de_hi[missing] = np.where(usable, 255 - exact[::-1].argmax(axis=0), 0)
+        _de_known[missing] = True
+    return _de_lo[chroma], _de_hi[chroma]
+
+def de_split(plane):
+    """平面切成相鄰像素對：(每對的第一個像素, 第二個像素)，int16"""
+    flat = np.ascontiguousarray(plane).ravel()
+    n = len(flat) // 2
+    return flat[0:2 * n:2].astype(np.int16), flat[1:2 * n:2].astype(np.int16)
+
+def de_pairs(plane):
+    """
+    每個像素對的整數平均 l 與差值 h（int16）
+    Pairs are consecutive pixels in raster order (of the ROI pixels when a
+    mask is used); with an odd pixel count the last pixel is left alone.
+    """
+    x, y = de_split(plane)
+    return (x + y) >> 1, x - y
+
+def de_chroma(img_ycrcb, region=None, count=None):
+    """
+    每個（允許區域內）像素的 chroma 索引 Cr * 256 + Cb，raster order
+    `count` keeps only the first pixels, e.g. to probe for a header.
+    """
+    pixels = img_ycrcb.reshape(-1, 3)
+    pixels = pixels[:count] if region is None else pixels[region[:count]]
+    return pixels[:, 1].astype(np.intp) << 8 | pixels[:, 2]
+
+def de_bounds(chroma):
+    """像素對兩個像素可用的 Y 範圍 (lo_x, hi_x, lo_y, hi_y)，依 de_chroma 查 de_bounds_table"""
+    lo, hi = de_bounds_table(chroma)
+    (lo_x, lo_y), (hi_x, hi_y) = de_split(lo), de_split(hi)
+    return lo_x, hi_x, lo_y, hi_y
+
+def de_classify(l, h, bounds=None):
+    """
+    (expandable, changeable)：哪些像素對可以擴展差值、哪些可以改差值的 LSB
+    Tian's scheme: h' = 2h + b (expand) or 2 * floor(h / 2) + b (change),
+    and the pair must stay valid for either bit b. Valid means inside
+    0..255 for a gray plane (bounds None), or inside each pixel's
+    round-trip range from de_bounds for the Y plane of a color image.
+    With k = h (expand) or floor(h / 2) (change) the new pixels are
+    x' = l + k + b and y' = l - k. Expanded and changed pairs are still
+    changeable afterwards and the rest are untouched, so the decoder
+    finds the same changeable pairs.
+    """
+    lo_x, hi_x, lo_y, hi_y = bounds if bounds is not None else (0, 255, 0, 255)
+
+    def valid(k):
+        return (l + k >= lo_x) & (l + k + 1 <= hi_x) & (l - k >= lo_y) & (l - k <= hi_y)
+
+    # With per-pixel ranges an expandable pair need not be changeable; it must
+    # be, since the decoder finds expanded pairs among the changeable ones
+    changeable = valid(h >> 1)
+    return valid(h) & changeable, changeable
+
+def de_location_map(expanded, changeable):
+    """壓縮後的 location map：每個 changeable 像素對一個 bit（1 = 差值被擴展）"""
+    return zlib.compress(np.packbits(expanded[changeable]).tobytes(), 9)
+
+def de_threshold(h, expandable, changeable, payload_bits, side_bits=0):
+    """
+    選擇能放下訊息的最小差值門檻 T：只擴展 |h| <= T 的 expandable 像素對
+    Every changeable pair carries one bit, but a changed (not expanded)
+    pair also costs one bit for its original LSB, so the room for the
+    payload is (#expanded) - header - side bits - location map. A small T
+    keeps the distortion low. Returns (T, location_map, room); T is None
+    when even T = 255 leaves less than payload_bits of room.
+    """
+    absh = np.abs(h)
+
+    def room(t):
+        expanded = expandable & (absh <= t)
+        location_map = de_location_map(expanded, changeable)
+        return int(np.count_nonzero(expanded)) - HEADER_BITS - side_bits - 8 * len(location_map), location_map
+
+    most, location_map = room(255)
+    if most < payload_bits:
+        return None, location_map, most
+    # Room grows with T except for small wobbles of the compressed map size
+    lo, hi = 0, 255
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if room(mid)[0] >= payload_bits:
+            hi = mid
+        else:
+            lo = mid + 1
+    while True:
+        fits, location_map = room(lo)
+        if fits >= payload_bits:
+            return lo, location_map, fits
+        lo += 1
+
+def embed_de_plane(Y, payload_bits, key=None, mask_descriptor=b'', bounds=None):
+    """
+    以 difference expansion 把訊息嵌入 Y 平面（或一維 ROI 平面），原地修改
+    The bit stream is header | location map | mask descriptor | original
+    LSBs of the changed pairs | payload, one bit per changeable pair in
+    carrier_order; changeable pairs past the end of the stream get b = 0
+    (expanded) or their own LSB back (changed, i.e. untouched). `bounds`
+    as in de_classify. Returns (info, error).
+    """
+    l, h = de_pairs(Y)
+    expandable, changeable = de_classify(l, h, bounds)
+    threshold, location_map, room = de_threshold(h, expandable, changeable, len(payload_bits), 8 * len(mask_descriptor))
+    if threshold is None:
+        return None, (f"Data too large to embed. Required: {len(payload_bits)} bits, "
+                      f"Available: {max(room, 0)} bits (difference expansion)")
+    if len(location_map) >= 2 ** HEADER_MAP_BITS:
+        return None, f"錯誤：location map 太大 ({len(location_map)} bytes)"
+
+    expanded = expandable & (np.abs(h) <= threshold)
+    changed = changeable & ~expanded
+    lsb = h & 1
+    body = np.concatenate([np.unpackbits(np.frombuffer(location_map + mask_descriptor, dtype=np.uint8)),
+                           lsb[changed].astype(np.uint8), bits_to_array(payload_bits)])
+    body_bits = (body + ord('0')).tobytes().decode('ascii')
+    header = build_header(DE_PEAK, threshold, len(payload_bits), location_map, mask_descriptor=mask_descriptor,
+                          payload_crc=bits_crc32(body_bits))
+    stream = np.concatenate([bits_to_array(header), body])
+
+    b = np.where(expanded, 0, lsb)
+    b[carrier_order(np.flatnonzero(changeable), len(changeable), key)[:len(stream)]] = stream
+    h_new = np.where(expanded, 2 * h + b, np.where(changed, (h >> 1) * 2 + b, h))
+
+    n = len(h)
+    flat = Y.ravel()
+    flat[0:2 * n:2] = l + ((h_new + 1) >> 1)
+    flat[1:2 * n:2] = l - (h_new >> 1)
+    print(f"[DEBUG] Difference expansion: T = {threshold}, {int(expanded.sum())} expanded / "
+          f"{int(changed.sum())} changed pairs, location map {len(location_map)} bytes")
+    return {
+        'threshold': threshold,
+        'expanded_pairs': int(np.count_nonzero(expanded)),
+        'changed_pairs': int(np.count_nonzero(changed)),
+        'location_map_bytes': len(location_map),
+        'capacity': room,
+        'used_bits': len(stream),
+        'full_data_bits': len(stream),
+    }, None
+
+def embed_message_de(img_color, message_bits, key=None, mask=None, profiler=None, out=None, hist=None):
+    """
+    以 Tian 的 difference expansion 嵌入訊息（單層）
+    An alternative to histogram shifting for images whose histogram has
+    no tall peak: up to about 0.5 bit per pixel in one pass. `key`,
+    `mask`, `profiler`, `out` and `hist` work as in embed_message_color,
+    and crdh.decode_image recognizes these images by their header.
+    Each pixel's Y may only move within the range that survives the
+    YCrCb <-> BGR round trip at its chroma (see de_bounds_table).
+    """
+    profiler = profiler or profiling.StageProfiler(enabled=False)
+    # The few pixels that do not survive YCrCb -> BGR -> YCrCb are read by
+    # any decoder at their round-tripped value; start from that value so
+    # the pair classification the decoder repeats is the same
+    prepared, error = _prepare_embedding(img_color, mask, profiler, out, hist, round_trip=True)
+    if error:
+        return None, error
+    img_ycrcb, Y_full, hist, region, mask_descriptor, Y = prepared
+
+    with profiler.stage("difference expansion"):
+        bounds = de_bounds(de_chroma(img_ycrcb, region))
+        info, error = embed_de_plane(Y, message_bits, key, mask_descriptor, bounds)
+    if error:
+        return None, error
+
+    with profiler.stage("merge + cvtColor YCrCb->BGR") as s:
+        if region is not None:
+            Y_full.ravel()[region] = Y
+        img_ycrcb[:, :, 0] = Y_full
+        embedded_color = cv2.cvtColor(img_ycrcb, cv2.COLOR_YCrCb2BGR, dst=img_ycrcb)
+        s['bytes_copied'] = Y_full.nbytes
+
+    # The decoder sees the image after BGR -> YCrCb: it must find the same
+    # changeable pairs with the same values
+    with profiler.stage("check YCrCb round trip"):
+        hist_embedded = cv2.calcHist([Y_full], [0], None, [256], [0, 256])
+        seen = cv2.cvtColor(embedded_color, cv2.COLOR_BGR2YCrCb)
+        seen_Y = region_plane(np.ascontiguousarray(seen[:, :, 0]), region)
+        _, changeable = de_classify(*de_pairs(Y), bounds)
+        _, seen_changeable = de_classify(*de_pairs(seen_Y), de_bounds(de_chroma(seen, region)))
+        carriers = np.repeat(changeable, 2)
+        same = (np.array_equal(changeable, seen_changeable)
+                and np.array_equal(seen_Y.ravel()[:len(carriers)][carriers], Y.ravel()[:len(carriers)][carriers]))
+    if not same:
+        return None, "錯誤：嵌入後的影像轉回 YCrCb 時像素值改變，無法可逆解碼；請改用 histogram shifting"
+
+    region_pixels = Y_full.size if region is None else len(region)
+    info.update({
+        'embedded_img': embedded_color,
+        'method': 'de',
+        'peak': DE_PEAK,
+        'zero': info['threshold'],
+        'bpp': len(message_bits) / region_pixels,
+        'region_pixels': region_pixels,
+        'mask_descriptor': mask_descriptor,
+        'hist': hist,
+        'hist_embedded': hist_embedded,
+    })
+    return info, None
+
+def analyze_image_for_embedding(img_path, payload_bits=None):
     """
     分析影像的嵌入能力
+    With `payload_bits` the recommendation is the cheapest plan for that
+    payload; without it, the single pair with the most room.
     """
     img = cv2.imread(img_path)
     if img is None:
@@ -102,14 +903,34 @@ def analyze_image_for_embedding(img_path):
     hist = cv2.calcHist([Y], [0], None, [256], [0, 256])
     peak = int(np.argmax(hist))
     capacity = int(hist[peak][0])
+
+    if payload_bits is None:
+        options = rank_pairs(hist, by='capacity')
+        recommendation = None if not options else {
+            'pairs': [(options[0]['peak'], options[0]['zero'])],
+            'capacity': options[0]['capacity'],
+            'shifted': options[0]['shifted'],
+            'psnr': options[0]['psnr']
+        }
+    else:
+        options = rank_pairs(hist, payload_bits)
+        recommendation = plan_embedding(hist, payload_bits)
     
     print(f"影像分析結果:")
     print(f"- Peak 值: {peak}")
     print(f"- Peak 像素數: {capacity}")
     print(f"- 最大可嵌入字元數: {capacity // 8}")
+    if recommendation:
+        pairs = ", ".join(f"peak {p} / zero {z}" for p, z in recommendation['pairs'])
+        print(f"- 建議: {pairs}，容量 {recommendation['capacity']} bits，位移 {recommendation['shifted']} 像素，"
+              f"預估 PSNR {recommendation['psnr']:.2f} dB")
+    else:
+        print("- 建議: 沒有單層或雙層方案放得下")
     
     return {
         'peak': peak,
         'capacity': capacity,
-        'max_chars': capacity // 8
-    }
\ No newline at end of file
+        'max_chars': capacity // 8,
+        'recommendation': recommendation,
+        'options': options
+    }
@@ -0,0 +1,91 @@
+# sidecar.py
+# Optional embed-time metadata: every layer's peak and size, the header
+# layout, the payload length and CRC32 and the mask descriptor, so the
+# decoder reads each layer in one pass instead of probing for the peak.
+# Stored as <image>.rdh.json next to the image, or as a tEXt chunk inside
+# PNG outputs. The secret key is never stored, only whether one was used.
+import base64
+import json
+import os
+import zlib
+
+import rdh
+import output_writer
+
+SIDECAR_FORMAT = 'rdh-sidecar'
+SIDECAR_VERSION = 1
+SIDECAR_SUFFIX = '.rdh.json'
+PNG_KEYWORD = 'rdh-sidecar'
+
+def build(result, payload, keyed=False):
+    """由 rdh.embed_message_color 的結果與訊息 bytes 建立 sidecar dict"""
+    return {
+        'format': SIDECAR_FORMAT,
+        'version': SIDECAR_VERSION,
+        'header_layout': [list(field) for field in rdh.HEADER_LAYOUT],
+        # Embedding order (layer 0 first); 'bits' counts the header too
+        'layers': [{'peak': l['peak'], 'zero': l['zero'], 'bits': l['full_data_bits']} for l in result['layers']],
+        'payload_bits': 8 * len(payload),
+        'payload_crc32': zlib.crc32(payload),
+        'keyed': keyed,
+        'mask': base64.b64encode(result['mask_descriptor']).decode('ascii'),
+    }
+
+def check(meta):
+    """回傳 sidecar 不能用的原因；可以用時回傳 None"""
+    if not isinstance(meta, dict) or meta.get('format') != SIDECAR_FORMAT:
+        return "not an RDH sidecar"
+    if meta.get('version') != SIDECAR_VERSION:
+        return f"unsupported sidecar version {meta.get('version')}"
+    if [tuple(field) for field in meta.get('header_layout', [])] != list(rdh.HEADER_LAYOUT):
+        return "header layout differs from this version"
+    layers = meta.get('layers')
+    if not layers or not isinstance(layers, list):
+        return "no layers recorded"
+    for l in layers:
+        if not (isinstance(l, dict) and isinstance(l.get('peak'), int) and 1 <= l['peak'] <= 255
+                and isinstance(l.get('bits'), int) and l['bits'] >= rdh.HEADER_BITS):
+            return "corrupt layer entry"
+    if not isinstance(meta.get('payload_crc32'), int) or not isinstance(meta.get('keyed'), bool):
+        return "missing payload checksum"
+    return None
+
+def mask_descriptor(meta):
+    return base64.b64decode(meta.get('mask', ''))
+
+def dumps(meta):
+    # Compact and ASCII only, so it also fits a Latin-1 PNG tEXt chunk
+    return json.dumps(meta, separators=(',', ':'))
+
+def png_text(meta):
+    """(keyword, text) for output_writer.write_image's tEXt chunk"""
+    return PNG_KEYWORD, dumps(meta)
+
+def sidecar_path(image_path):
+    return image_path + SIDECAR_SUFFIX
+
+def write(image_path, meta):
+    """寫出 <image>.rdh.json，回傳路徑"""
+    path = sidecar_path(image_path)
+    with open(path, 'w', encoding='ascii') as f:
+        f.write(dumps(meta))
+    return path
+
+def read(image_path):
+    """讀取影像的 sidecar（先找 .rdh.json，再找 PNG tEXt chunk）；沒有或損壞時回傳 None"""
+    text = None
+    path = sidecar_path(image_path)
+    if os.path.exists(path):
+        try:
+            with open(path, encoding='ascii') as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            text = None
+    if text is None:
+        text = output_writer.read_png_text(image_path, PNG_KEYWORD)
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
@@ -0,0 +1,123 @@
+# test_rdh.py
+import contextlib
+import io
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rdh
+import crdh
+
+@pytest.fixture(autouse=True)
+def quiet():
+    # rdh / crdh print a debug line for every step
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def plane(seed=0):
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(128, 20, (120, 160)), 0, 255).astype(np.uint8)
+
+def color_image(seed=5):
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur(rng.integers(0, 256, (120, 160, 3), dtype=np.uint8), (9, 9), 3)
+
+def y_plane(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2YCrCb)[:, :, 0]
+
+def embedded_plane(payload_bits, pair=None):
+    Y = plane()
+    embedded, info, error = rdh.embed_layer(Y.copy(), payload_bits, pair=pair)
+    assert error is None
+    return Y, embedded, info
+
+def flip_carrier(Y, peak, index):
+    """Move the index-th carrier between peak and peak-1, i.e. flip one embedded bit."""
+    flat = Y.ravel()
+    carrier = np.flatnonzero((flat == peak) | (flat == peak - 1))[index]
+    flat[carrier] = peak - 1 if flat[carrier] == peak else peak
+
+def test_header_round_trip():
+    location_map = bytes(range(10))
+    header = crdh.parse_header(rdh.build_header(140, 70, 12345, location_map, layer=3, next_peak=99,
+                                                mask_descriptor=b'R\x00\x00', payload_crc=0xDEADBEEF))
+    assert len(rdh.build_header(140, 70, 12345)) == rdh.HEADER_BITS == 144
+    assert header == {'peak': 140, 'length': 12345, 'zero': 70, 'map_size': 10, 'layer': 3, 'next_peak': 99,
+                      'mask_size': 3, 'payload_crc': 0xDEADBEEF, 'header_ok': True}
+
+def test_header_checksum_rejects_tampering():
+    bits = rdh.build_header(140, 70, 12345, payload_crc=7)
+    for i in (0, 20, 100, rdh.HEADER_BITS - 1):
+        tampered = bits[:i] + ('1' if bits[i] == '0' else '0') + bits[i + 1:]
+        assert not crdh.parse_header(tampered)['header_ok']
+
+def test_layer_round_trip():
+    message = rdh.text_to_bits("plane round trip")
+    Y, embedded, info = embedded_plane(message)
+    layer, error = crdh.decode_layer(embedded, [info['peak']], [])
+    assert error is None
+    assert layer['message_bits'] == message
+    assert np.array_equal(layer['restored_Y'], Y)
+
+def test_overflow_location_map_round_trip():
+    Y = plane()
+    hist = cv2.calcHist([Y], [0], None, [256], [0, 256]).ravel()
+    peak = int(np.argmax(hist))
+    # The sparsest populated bin below the peak: its pixels must be told apart from the shifted ones
+    below = np.flatnonzero(hist[:peak - 1])
+    zero = int(below[np.argmin(hist[below])])
+    message = rdh.text_to_bits("overflow")
+    Y, embedded, info = embedded_plane(message, pair=(peak, zero))
+    assert info['overflow'] == hist[zero]
+    assert info['location_map_bytes'] > 0
+
+    layer, error = crdh.decode_layer(embedded, [peak], [])
+    assert error is None
+    assert layer['map_size'] == info['location_map_bytes']
+    assert layer['message_bits'] == message
+    assert np.array_equal(layer['restored_Y'], Y)
+
+def test_tampered_header_is_rejected():
+    _, embedded, info = embedded_plane(rdh.text_to_bits("header"))
+    flip_carrier(embedded, info['peak'], 20)  # inside the length field
+    layer, error = crdh.decode_layer(embedded, [info['peak']], [])
+    assert layer is None
+    assert "Header" in error
+
+def test_payload_crc_mismatch_is_detected():
+    message = rdh.text_to_bits("crc check")
+    _, embedded, info = embedded_plane(message)
+    flip_carrier(embedded, info['peak'], rdh.HEADER_BITS + info['location_map_bytes'] * 8 + 5)
+    layer, error = crdh.decode_layer(embedded, [info['peak']], [])
+    assert layer is None
+    assert "CRC32" in error
+
+@pytest.mark.parametrize('options, repeat, layers', [
+    ({}, 2, 1),
+    ({'key': 'secret'}, 2, 1),
+    ({'mask': [(8, 6, 96, 72), (120, 40, 32, 48)]}, 1, 1),
+    ({'max_layers': 4, 'key': 'secret'}, 12, 2),  # too much for one layer
+])
+def test_image_round_trip(options, repeat, layers):
+    img = color_image()
+    payload = "reversible ✓ 資料".encode('utf-8') * repeat
+    result, error = rdh.embed_message_color(img, rdh.bytes_to_bits(payload), **options)
+    assert error is None
+    assert len(result['layers']) >= layers
+
+    decoded, error = crdh.decode_image(result['embedded_img'], key=options.get('key'), mask=options.get('mask'))
+    assert error is None
+    assert decoded['payload'] == payload
+    assert np.array_equal(y_plane(decoded['restored_img']), y_plane(img))
+
+def test_wrong_key_fails_the_header_check():
+    img = color_image()
+    result, error = rdh.embed_message_color(img, rdh.text_to_bits("keyed"), key="right")
+    assert error is None
+    decoded, error = crdh.decode_image(result['embedded_img'], key="wrong")
+    assert decoded is None
+    assert "Header" in error
@@ -0,0 +1,72 @@
+# test_verify.py
+import contextlib
+import io
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rdh
+import verify
+from image_io import parse_rects
+
+RECTS = "8,6,96,72;120,40,32,48"
+
+def embedded_image(tmp_path, name="roi.png"):
+    rng = np.random.default_rng(5)
+    img = cv2.GaussianBlur(rng.integers(0, 256, (120, 160, 3), dtype=np.uint8), (9, 9), 3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result, error = rdh.embed_message_color(img, rdh.text_to_bits("roi check"), key="k",
+                                                mask=parse_rects(RECTS))
+    assert error is None
+    path = str(tmp_path / name)
+    cv2.imwrite(path, result['embedded_img'])
+    return path
+
+def test_verify_with_rects(tmp_path, capsys):
+    path = embedded_image(tmp_path)
+    db = str(tmp_path / "db.json")
+    args = [path, "--rects", RECTS, "--key", "k", "--db", db, "--workers", "1"]
+
+    assert verify.main(args) == 0
+    entry = json.load(open(db, encoding='utf-8'))['images'][os.path.abspath(path)]
+    assert entry['report']['status'] in ('EXACT', 'Y-EXACT')
+
+    # Unchanged file, same settings: served from the database
+    assert verify.main(args) == 0
+    assert "0 verified, 1 unchanged" in capsys.readouterr().out
+
+def test_verify_mask_size_mismatch(tmp_path):
+    path = embedded_image(tmp_path)
+    report = verify.verify_image(path, key="k", mask=np.ones((10, 10), dtype=bool))
+    assert report['status'] == 'FAIL'
+    assert report['error'] == "Mask size does not match the image"
+
+def test_verify_job_exception_is_a_fail(tmp_path, capsys):
+    path = embedded_image(tmp_path)
+    mask = tmp_path / "mask.png"
+    mask.write_text("not an image")  # rdh.load_mask raises in the worker
+    db = str(tmp_path / "db.json")
+
+    assert verify.main([path, "--mask", str(mask), "--key", "k", "--db", db, "--workers", "1"]) == 1
+    assert "FAIL" in capsys.readouterr().out
+    # The database is still written, without an entry for the failed job
+    assert json.load(open(db, encoding='utf-8'))['images'] == {}
+
+def test_verify_missing_mask_file(tmp_path):
+    path = embedded_image(tmp_path)
+    with pytest.raises(SystemExit) as exc:
+        verify.main([path, "--mask", str(tmp_path / "missing.png"), "--db", str(tmp_path / "db.json")])
+    assert exc.value.code == 2
+
+def test_settings_id_array_mask():
+    mask = np.zeros((4, 6), dtype=bool)
+    other = mask.copy()
+    other[1, 2] = True
+    assert verify.settings_id(mask=mask) == verify.settings_id(mask=mask.copy())
+    assert verify.settings_id(mask=mask) != verify.settings_id(mask=other)
+    assert verify.settings_id(mask=mask) != verify.settings_id(mask=mask.reshape(6, 4))
@@ -0,0 +1,77 @@
+# thumbnails.py
+# Preview thumbnails for the GUI: each source image is decoded and shrunk
+# once with cv2.resize(INTER_AREA); every preview size is derived from
+# that small copy and cached as a QPixmap.
+import os
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PyQt5.QtGui import QPixmap, QImage
+
+import output_writer
+from image_cache import file_mtime
+
+THUMBNAIL_MAX = 400       # largest preview in the GUI; smaller ones are resized from this copy
+THUMBNAIL_SOURCES = 32    # source images kept (each at most 400x400x3 bytes)
+
+def bgr_to_pixmap(img):
+    """BGR (or gray) ndarray -> QPixmap, without writing a file"""
+    code = cv2.COLOR_GRAY2RGB if img.ndim == 2 else cv2.COLOR_BGR2RGB
+    rgb = np.ascontiguousarray(cv2.cvtColor(img, code))
+    h, w = rgb.shape[:2]
+    return QPixmap.fromImage(QImage(rgb.data, w, h, 3 * w, QImage.Format_RGB888))
+
+def fit(img, size):
+    """等比例縮放到 size（int 或 (w, h)）的框內；縮小用 INTER_AREA"""
+    box_w, box_h = (size, size) if isinstance(size, int) else size
+    h, w = img.shape[:2]
+    scale = min(box_w / w, box_h / h)
+    if scale == 1:
+        return img
+    new_size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(img, new_size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+class ThumbnailCache:
+    """
+    Sources are keyed by absolute path. An array registered with put_array
+    (e.g. a freshly embedded image whose file is still being written) is
+    trusted as is; a source loaded from disk is reloaded when the file's
+    modification time changes.
+    """
+
+    def __init__(self, max_sources=THUMBNAIL_SOURCES):
+        self.max_sources = max_sources
+        self._sources = OrderedDict()  # path -> (mtime or None, small BGR copy), LRU order
+        self._pixmaps = {}             # (path, size) -> QPixmap
+
+    def put_array(self, path, img, mtime=None):
+        """登錄記憶體中的影像（不讀檔）"""
+        key = os.path.abspath(path)
+        self._drop(key)
+        self._sources[key] = (mtime, fit(img, THUMBNAIL_MAX) if max(img.shape[:2]) > THUMBNAIL_MAX else img.copy())
+        while len(self._sources) > self.max_sources:
+            self._drop(next(iter(self._sources)))
+
+    def get(self, path, size):
+        """取得 path 在 size 框內的預覽圖；沒有登錄過就從檔案讀一次"""
+        key = os.path.abspath(path)
+        entry = self._sources.get(key)
+        if entry is None or (entry[0] is not None and entry[0] != file_mtime(key)):
+            img = output_writer.load_image(key)
+            if img is None:
+                return QPixmap()
+            self.put_array(key, img, file_mtime(key))
+        self._sources.move_to_end(key)
+
+        size_key = size if isinstance(size, int) else tuple(size)
+        pixmap = self._pixmaps.get((key, size_key))
+        if pixmap is None:
+            pixmap = bgr_to_pixmap(fit(self._sources[key][1], size_key))
+            self._pixmaps[(key, size_key)] = pixmap
+        return pixmap
+
+    def _drop(self, key):
+        self._sources.pop(key, None)
+        for k in [k for k in self._pixmaps if k[0] == key]:
+            del self._pixmaps[k]
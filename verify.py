@@ -0,0 +1,230 @@
+# verify.py
+# Incremental verification of already-embedded images: decode each one,
+# restore it, re-embed the decoded payload the same way (same (peak, zero)
+# pairs, or difference expansion) and check that the embedded pixels come
+# back. Results are stored per content hash, so a later run skips every
+# file that has not changed and only sends the rest to the warm worker pool.
+#
+#   python verify.py images/ --key secret --workers 4 --db tempFile/verify_db.json
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import as_completed
+
+import cv2
+import numpy as np
+import rdh
+import crdh
+import output_writer
+import sidecar
+from image_io import collect_images, parse_rects
+from batch_jobs import BatchRunner
+
+DB_FORMAT = 'rdh-verify-db'
+DB_VERSION = 1
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tempFile", "verify_db.json")
+
+def file_hash(path, chunk_size=1 << 20):
+    """檔案內容的 SHA-256（hex）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def settings_id(key=None, mask=None):
+    """
+    Identifies the decode settings a result was verified with, so changing
+    the key or the mask re-verifies everything. The key goes through
+    PBKDF2 and is never stored; a mask file or array is identified by its
+    content.
+    """
+    key_part = hashlib.pbkdf2_hmac('sha256', key.encode('utf-8'), DB_FORMAT.encode('ascii'), 100000).hex() if key else ''
+    if mask is None:
+        mask_part = ''
+    elif isinstance(mask, str):
+        mask_part = file_hash(mask)
+    elif isinstance(mask, np.ndarray):
+        mask_part = hashlib.sha256(repr(mask.shape).encode('ascii') + mask.astype(bool).tobytes()).hexdigest()
+    else:
+        mask_part = repr(mask)
+    return hashlib.sha256(f"{key_part}|{mask_part}".encode('ascii')).hexdigest()[:16]
+
+def load_db(path):
+    """讀取驗證資料庫；沒有、損壞或版本不同時回傳空的資料庫"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            db = json.load(f)
+    except (OSError, ValueError):
+        db = None
+    if not isinstance(db, dict) or db.get('format') != DB_FORMAT or db.get('version') != DB_VERSION:
+        db = {'format': DB_FORMAT, 'version': DB_VERSION, 'images': {}}
+    return db
+
+def save_db(path, db):
+    # Written to a temporary file first, so an interrupted run never leaves half a database
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(db, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def verify_image(path, digest=None, key=None, mask=None):
+    """
+    解碼、還原並重新嵌入一張影像，回傳驗證報告
+    EXACT: re-embedding the restored image reproduces every BGR pixel;
+    Y-EXACT: only the Y plane the data lives in (see audit.py). When the
+    image has a valid sidecar, the payload must also match its CRC32.
+    """
+    report = {'path': path, 'sha256': digest, 'status': 'FAIL', 'error': None, 'peak': None, 'layers': None,
+              'payload_bits': None, 'payload_crc32': None, 'restore_exact': False, 'sidecar': False,
+              'verify_ms': None}
+    start = time.perf_counter()
+    img = output_writer.load_image(path)
+    if img is None:
+        report['error'] = "Failed to load image"
+        return report
+
+    if isinstance(mask, str):
+        mask = rdh.load_mask(mask)
+    meta = sidecar.read(path)
+    if meta is not None and sidecar.check(meta) is not None:
+        meta = None
+    report['sidecar'] = meta is not None
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if isinstance(mask, np.ndarray) and mask.shape != img.shape[:2]:
+            report['error'] = "Mask size does not match the image"
+            return report
+        decoded, error = crdh.decode_image(img, key=key, mask=mask, sidecar=meta)
+        if error:
+            report['error'] = error
+            return report
+        payload = decoded['payload']
+        report.update({'peak': decoded['extracted_peak'], 'layers': decoded['layers'],
+                       'payload_bits': 8 * len(payload), 'payload_crc32': zlib.crc32(payload)})
+        if meta is not None and report['payload_crc32'] != meta['payload_crc32']:
+            report['error'] = "Payload CRC32 differs from the sidecar"
+            return report
+
+        # The mask may have come from the sidecar; re-embedding needs it too
+        if mask is None and meta is not None:
+            mask = crdh.decode_mask(sidecar.mask_descriptor(meta), img.shape[:2])
+        if decoded['method'] == 'de':
+            again, error = rdh.embed_message_de(decoded['restored_img'], rdh.bytes_to_bits(payload), key=key, mask=mask)
+        else:
+            again, error = rdh.embed_message_color(decoded['restored_img'], rdh.bytes_to_bits(payload), key=key,
+                                                   mask=mask, plan=decoded['pairs'])
+    if error:
+        report['error'] = f"Re-embedding failed: {error}"
+        return report
+
+    report['restore_exact'] = bool(np.array_equal(again['embedded_img'], img))
+    if report['restore_exact']:
+        report['status'] = 'EXACT'
+    elif np.array_equal(cv2.cvtColor(again['embedded_img'], cv2.COLOR_BGR2YCrCb)[:, :, 0],
+                        cv2.cvtColor(img, cv2.COLOR_BGR2YCrCb)[:, :, 0]):
+        report['status'] = 'Y-EXACT'
+    else:
+        report['error'] = "Restored image does not re-embed to the same pixels"
+    report['verify_ms'] = (time.perf_counter() - start) * 1000
+    return report
+
+def run_verify(paths, db, key=None, mask=None, workers=None, force=False):
+    """
+    驗證多張影像並更新 db（in place），回傳 (reports, skipped)
+    Files are hashed here; a file whose hash and settings match its stored
+    entry is skipped and its stored report returned. The rest run on one
+    BatchRunner, whose workers import and warm up once for the whole run.
+    A job that raises is reported as FAIL and not stored, so it is retried
+    on the next run.
+    """
+    settings = settings_id(key, mask)
+    images = db['images']
+    reports = {}
+    pending = []
+    previous = {}
+    for path in paths:
+        entry = images.get(os.path.abspath(path))
+        try:
+            digest = file_hash(path)
+        except OSError as e:
+            reports[path] = {'path': path, 'sha256': None, 'status': 'FAIL', 'error': str(e)}
+            continue
+        if not force and entry and entry['sha256'] == digest and entry['settings'] == settings:
+            reports[path] = dict(entry['report'], path=path, cached=True)
+        else:
+            pending.append((path, digest))
+            previous[path] = entry['sha256'] if entry else None
+
+    if pending:
+        runner = BatchRunner(workers)
+        try:
+            futures = {runner.submit(verify_image, path, digest, key, mask): (path, digest) for path, digest in pending}
+            for future in as_completed(futures):
+                path, digest = futures[future]
+                try:
+                    report = future.result()
+                except Exception as e:  # the job raised, or its worker crashed
+                    reports[path] = {'path': path, 'sha256': digest, 'status': 'FAIL',
+                                     'error': str(e) or type(e).__name__, 'cached': False}
+                    continue
+                report['cached'] = False
+                report['changed'] = previous[path] not in (None, digest)
+                reports[path] = report
+                images[os.path.abspath(path)] = {
+                    'sha256': report['sha256'],
+                    'settings': settings,
+                    'verified_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'report': {k: v for k, v in report.items() if k not in ('path', 'cached', 'changed')},
+                }
+        finally:
+            runner.shutdown()
+
+    reports = [reports[path] for path in paths]
+    return reports, sum(1 for r in reports if r.get('cached'))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental verification of RDH-embedded images")
+    parser.add_argument('inputs', nargs='+', help="embedded image files or folders")
+    parser.add_argument('--key', default=None, help="secret key used when embedding")
+    parser.add_argument('--mask', default=None, help="binary mask image (white = may be modified)")
+    parser.add_argument('--rects', default=None, help="ROI rectangles 'x,y,w,h;x,y,w,h'")
+    parser.add_argument('--workers', type=int, default=None, help="parallel worker processes")
+    parser.add_argument('--db', default=DEFAULT_DB, help="verification database (JSON)")
+    parser.add_argument('--force', action='store_true', help="re-verify unchanged files too")
+    args = parser.parse_args(argv)
+    if args.mask and not os.path.isfile(args.mask):
+        parser.error(f"mask file not found: {args.mask}")
+
+    paths = collect_images(args.inputs)
+    if not paths:
+        print("No images found")
+        return 1
+
+    db = load_db(args.db)
+    mask = parse_rects(args.rects) if args.rects else args.mask
+    reports, skipped = run_verify(paths, db, args.key, mask, args.workers, args.force)
+    save_db(args.db, db)
+
+    counts = {'EXACT': 0, 'Y-EXACT': 0, 'FAIL': 0}
+    for r in reports:
+        counts[r['status']] += 1
+        source = "cached" if r.get('cached') else "changed" if r.get('changed') else "verified"
+        if r['error']:
+            print(f"{r['status']:8} {r['path']}  ({source}) error: {r['error']}")
+        else:
+            print(f"{r['status']:8} {r['path']}  ({source}) peak={r['peak']} layers={r['layers']} "
+                  f"payload={r['payload_bits']} bits crc32={r['payload_crc32']:08x}")
+    print(f"Total {len(reports)}: {counts}, {len(reports) - skipped} verified, {skipped} unchanged")
+    print(f"Database written to {args.db}")
+
+    return 0 if counts['FAIL'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())